@@ -0,0 +1,32 @@
+"""
+Deleting expired rows without long locks.
+
+Sweepers remove rows a batch at a time, each batch a short DELETE by
+primary key, so a large backlog never holds one long transaction.
+"""
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_BATCH = 1000
+
+def delete_in_batches(queryset, batch_size=DEFAULT_BATCH):
+    """Delete every row of queryset, batch_size rows per statement; returns the count"""
+    deleted = 0
+    model = queryset.model
+    while ids := list(queryset.values_list('pk', flat=True)[:batch_size]):
+        deleted += model._base_manager.filter(pk__in=ids).delete()[0]
+    return deleted
+
+class SweepCommand(BaseCommand):
+    """Management command running a sweep(batch_size) function; subclasses set sweep and noun"""
+    noun = 'rows'
+
+    def sweep(self, batch_size):
+        raise NotImplementedError
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='Rows per DELETE')
+
+    def handle(self, *args, **options):
+        deleted = self.sweep(options['batch'])
+        self.stdout.write(f'Deleted {deleted} {self.noun}')
@@ -0,0 +1,46 @@
+"""
+Benchmarks that never touch the real database.
+
+A bench generates its own users, rooms and tables, sometimes a million
+rows of them. Running it against the configured database would leave
+them behind whenever the run is interrupted. BenchCommand runs the
+bench against a freshly migrated scratch database instead, created
+before any row is written and dropped however the run ends.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+@contextmanager
+def scratch_database():
+    """Point the default connection at a throwaway migrated database for the block"""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    scratch_dir = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        # A file rather than SQLite's in-memory test database, so threaded
+        # benches see the same locking as the real one
+        scratch_dir = tempfile.mkdtemp(prefix='bench-')
+        test_settings['NAME'] = os.path.join(scratch_dir, 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if scratch_dir is not None:
+            del test_settings['NAME']
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+class BenchCommand(BaseCommand):
+    """Management command running bench(**options) inside scratch_database()"""
+
+    def bench(self, *args, **options):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.bench(*args, **options)
@@ -0,0 +1,189 @@
+"""
+Token-bucket rate limiting.
+
+Each scope in RATE_LIMITS, e.g. ``'login': '10/min'``, gives every key
+(an IP, a user id, an invitation token) a bucket of that many tokens,
+refilled continuously over the period. A request spends one token; an
+empty bucket rejects it with the seconds until the next token.
+
+Buckets live in this process's memory unless RATE_LIMIT_STORAGE is
+'cache', which shares them through the default cache (Redis in
+production). The cache read-modify-write is not atomic, so concurrent
+requests for one key across processes can each spend the same token;
+limits are approximate by design.
+
+Rejections are counted per scope in the cache and served to staff at
+/api/ratelimit/.
+"""
+
+import math
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import JsonResponse
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# In-memory buckets kept per scope before idle (refilled) ones are dropped
+MAX_KEYS = 100_000
+monotonic = time.monotonic
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60)"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+def client_ip(request):
+    """REMOTE_ADDR, or the X-Forwarded-For hop added by the last of NUM_PROXIES trusted proxies"""
+    return BaseThrottle().get_ident(request)
+
+def rejected_key(scope):
+    return f'ratelimit:rejected:{scope}'
+
+class MemoryBuckets:
+    """
+    Buckets in a plain dict. There is no lock: the GIL keeps each dict
+    operation whole, and threads racing on one key at worst both spend
+    the same token.
+    """
+
+    def __init__(self, scope, period):
+        self.period = period
+        self.buckets = {}
+
+    def take(self, key, capacity, refill):
+        """Spend a token for key; 0.0 if allowed, else seconds until one is available"""
+        now = monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_KEYS:
+                self.prune(now)
+            self.buckets[key] = [capacity - 1, now]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * refill
+        if tokens > capacity:
+            tokens = capacity
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / refill
+
+    def prune(self, now):
+        # A bucket untouched for a whole period has refilled, so forgetting it changes nothing
+        idle_since = now - self.period
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[1] > idle_since}
+
+class CacheBuckets:
+    def __init__(self, scope, period):
+        self.scope = scope
+        self.period = period
+
+    def take(self, key, capacity, refill):
+        now = time.time()
+        cache_key = f'ratelimit:{self.scope}:{key}'
+        tokens, stamp = cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - stamp) * refill)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / refill
+        cache.set(cache_key, (tokens - 1 if wait == 0.0 else tokens, now), self.period)
+        return wait
+
+STORAGES = {'memory': MemoryBuckets, 'cache': CacheBuckets}
+
+class RateLimiter:
+    def __init__(self, scope, rate, storage=None):
+        self.scope = scope
+        self.capacity, period = parse_rate(rate)
+        self.refill = self.capacity / period
+        self.buckets = STORAGES[storage or settings.RATE_LIMIT_STORAGE](scope, period)
+
+    def check(self, key):
+        """0.0 if the request may proceed, else the seconds to wait before retrying"""
+        wait = self.buckets.take(key, self.capacity, self.refill)
+        if wait:
+            self.count_rejection()
+        return wait
+
+    async def acheck(self, key):
+        """check() for async code: cache round trips run off the event loop"""
+        if not isinstance(self.buckets, MemoryBuckets):
+            return await sync_to_async(self.check)(key)
+        wait = self.buckets.take(key, self.capacity, self.refill)
+        if wait:
+            await sync_to_async(self.count_rejection)()
+        return wait
+
+    def count_rejection(self):
+        cache.add(rejected_key(self.scope), 0, None)
+        cache.incr(rejected_key(self.scope))
+
+_limiters = {}
+
+def limiter(scope):
+    try:
+        return _limiters[scope]
+    except KeyError:
+        return _limiters.setdefault(scope, RateLimiter(scope, settings.RATE_LIMITS[scope]))
+
+def reset():
+    """Forget every in-memory bucket (settings changes and tests)"""
+    _limiters.clear()
+
+@receiver(setting_changed)
+def reset_limiters(setting, **kwargs):
+    if setting in ('RATE_LIMITS', 'RATE_LIMIT_STORAGE'):
+        reset()
+
+def rejected_counts():
+    counts = cache.get_many([rejected_key(scope) for scope in settings.RATE_LIMITS])
+    return {scope: counts.get(rejected_key(scope), 0) for scope in settings.RATE_LIMITS}
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def stats_view(request):
+    return Response({'rejected': rejected_counts()})
+
+def too_many_requests(wait):
+    """429 response for plain Django views; DRF views raise Throttled instead"""
+    response = JsonResponse({'detail': 'Request was throttled.'}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+class BucketThrottle(BaseThrottle):
+    """
+    DRF throttle over one or more (scope, key) buckets.
+
+    Subclasses implement get_keys(); a request spends a token from every
+    bucket and waits for the slowest one.
+    """
+
+    def get_keys(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_time = max(
+            (limiter(scope).check(key) for scope, key in self.get_keys(request, view) if key),
+            default=0.0
+        )
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+class MessageSendThrottle(BucketThrottle):
+    def get_keys(self, request, view):
+        return [('message_send', request.user.pk)]
+
+class InvitationInfoThrottle(BucketThrottle):
+    def get_keys(self, request, view):
+        return [
+            ('invite_info', self.get_ident(request)),
+            ('invite_token', request.query_params.get('token')),
+        ]
@@ -1,5 +1,6 @@
 ﻿# backend/config/settings.py
 import os
+from datetime import timedelta
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -10,6 +11,7 @@ DEBUG = True
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
 INSTALLED_APPS = [
+    'daphne',  # must precede staticfiles so runserver serves ASGI
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -18,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
+    'channels',
     'user_accounts',
     'messaging',
     'video_calls',
@@ -55,6 +58,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 DATABASES = {
     'default': {
@@ -63,17 +67,104 @@ DATABASES = {
     }
 }
 
+AUTH_USER_MODEL = 'user_accounts.User'
+
+# Session requests load request.user through user_cache rather than the users table
+AUTHENTICATION_BACKENDS = [
+    'user_accounts.backends.EmailBackend',
+    # Still listed so sessions started before the email backend stay valid; checks no passwords
+    'user_accounts.backends.CachedModelBackend',
+]
+
+# Sessions are read from the cache and written through to django_session,
+# so a cache miss or restart only costs a database read.
+# Set SESSION_ENGINE=django.contrib.sessions.backends.db to bypass the cache.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
 AUTH_PASSWORD_VALIDATORS = []
 
+# PBKDF2 work factor for new and rehashed passwords; OWASP's floor for
+# PBKDF2-SHA256 is 600,000. Lower it only in tests.
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600_000))
+PASSWORD_HASHERS = [
+    'user_accounts.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Threads verifying passwords for the async login view
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'user_accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Reverse proxies in front of the app; client IPs (rate-limit keys) come from
+    # X-Forwarded-For only when this is set, otherwise from REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # Writes binary message fields (ciphertext, nonce, tag) as base64
+    'DEFAULT_RENDERER_CLASSES': [
+        'messaging.renderers.BinaryJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Signed bearer tokens; validating one needs no database query
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+
+# Channels: Redis in production, in-memory for local development and tests
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+    }
+
+# Presence and other shared ephemeral state; per-process memory without Redis
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
+
+# Token buckets per scope: '<requests>/<s|min|hour|day>', refilled continuously
+RATE_LIMITS = {
+    'login': '10/min',  # per client IP
+    'login_email': '5/min',  # per account being tried
+    'invite_info': '30/min',  # per client IP
+    'invite_token': '120/min',  # per invitation token
+    'message_send': '120/min',  # per user, REST and WebSocket
 }
+# 'memory' keeps buckets per process; 'cache' shares them through CACHES
+RATE_LIMIT_STORAGE = 'cache' if REDIS_URL else 'memory'
+
+# Two-factor codes are emailed; the console backend prints them in development
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
+# Calling code (e.g. '44') for phone numbers written without one
+DEFAULT_COUNTRY_CALLING_CODE = os.environ.get('DEFAULT_COUNTRY_CALLING_CODE')
 
 CORS_ALLOWED_ORIGINS = ["http://localhost:3000"]
 CORS_ALLOW_CREDENTIALS = True
@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
+from . import ratelimit
 
 def api_root(request):
     return JsonResponse({
@@ -26,6 +27,7 @@ urlpatterns = [
     path('api/status/', include('user_status.urls')),
     path('api/invite/', include('invitations.urls')),
     path('api/video/', include('video_calls.urls')),
+    path('api/ratelimit/', ratelimit.stats_view, name='ratelimit-stats'),
 ]
 
 if settings.DEBUG:
@@ -5,13 +5,14 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from config.ids import uuid7
 
 def generate_invite_token():
     """Generate a secure invite token"""
     return ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
 
 class Invitation(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='invitations')
     token = models.CharField(max_length=32, unique=True, default=generate_invite_token)
     
@@ -1,7 +1,10 @@
 from rest_framework import serializers
+from django.contrib.auth import get_user_model
 from user_accounts.serializers import UserPublicSerializer
 from .models import Invitation, InvitationUsage
 
+User = get_user_model()
+
 class InvitationUsageSerializer(serializers.ModelSerializer):
     user = UserPublicSerializer(read_only=True)
     
@@ -33,10 +36,17 @@ class InvitationSerializer(serializers.ModelSerializer):
     def get_remaining_uses(self, obj):
         return max(0, obj.max_uses - obj.uses_count)
 
+class InvitationOwnerSerializer(serializers.ModelSerializer):
+    """What anyone holding an invite token may see of its owner"""
+    
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'avatar', 'bio']
+
 class InvitationInfoSerializer(serializers.Serializer):
     """Serializer for invitation info (public data)"""
     valid = serializers.BooleanField()
-    owner = UserPublicSerializer(required=False)
+    owner = InvitationOwnerSerializer(required=False)
     created_at = serializers.DateTimeField(required=False)
     expires_at = serializers.DateTimeField(required=False, allow_null=True)
     remaining_uses = serializers.IntegerField(required=False)
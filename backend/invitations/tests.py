@@ -1,3 +1,45 @@
-from django.test import TestCase
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from config import ratelimit
+from .models import Invitation, QRCodeSession
 
-# Create your tests here.
+User = get_user_model()
+
+@override_settings(RATE_LIMITS={'invite_info': '100/min', 'invite_token': '2/min'})
+class InvitationInfoThrottleTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com')
+        self.invitation = Invitation.objects.create(owner=self.owner)
+        self.client = APIClient()
+
+    def info(self, token):
+        return self.client.get('/api/invite/info/', {'token': token})
+
+    def test_token_bucket_stops_scan_writes(self):
+        self.assertEqual(self.info(self.invitation.token).status_code, 200)
+        self.assertEqual(self.info(self.invitation.token).status_code, 200)
+        response = self.info(self.invitation.token)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+        self.assertEqual(QRCodeSession.objects.count(), 2)
+
+        # Other tokens have their own buckets; the bucket refills over time
+        self.assertFalse(self.info('unknown').data['valid'])
+        with mock.patch('config.ratelimit.monotonic', return_value=ratelimit.monotonic() + 30):
+            self.assertEqual(self.info(self.invitation.token).status_code, 200)
+
+        self.client.force_authenticate(User.objects.create_user(
+            username='admin', email='admin@example.com', is_staff=True
+        ))
+        self.assertEqual(self.client.get('/api/ratelimit/').data['rejected']['invite_token'], 1)
+
+class InvitationInfoTests(TestCase):
+    def test_anonymous_info_shows_only_public_owner_fields(self):
+        owner = User.objects.create_user(username='owner', email='owner@example.com', bio='hi')
+        invitation = Invitation.objects.create(owner=owner)
+        data = APIClient().get('/api/invite/info/', {'token': invitation.token}).data
+        self.assertTrue(data['valid'])
+        self.assertEqual(set(data['owner']), {'id', 'username', 'avatar', 'bio'})
+        self.assertNotIn('email', data['owner'])
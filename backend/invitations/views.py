@@ -4,7 +4,8 @@ from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from messaging.models import Room, RoomParticipant
+from config.ratelimit import InvitationInfoThrottle
+from messaging.models import Room
 from .models import Invitation, InvitationUsage, QRCodeSession
 from .serializers import (
     InvitationSerializer, InvitationInfoSerializer, AcceptInvitationSerializer
@@ -51,7 +52,10 @@ class InvitationViewSet(viewsets.ModelViewSet):
         serializer = InvitationSerializer(invitation, context={'request': request})
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    @action(
+        detail=False, methods=['get'], permission_classes=[permissions.AllowAny],
+        throttle_classes=[InvitationInfoThrottle]
+    )
     def info(self, request):
         """Get invitation info (public endpoint)"""
         token = request.query_params.get('token')
@@ -62,7 +66,7 @@ class InvitationViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            invitation = Invitation.objects.get(token=token)
+            invitation = Invitation.objects.select_related('owner').get(token=token)
             
             # Track QR code scan
             QRCodeSession.objects.create(
@@ -74,12 +78,7 @@ class InvitationViewSet(viewsets.ModelViewSet):
             if invitation.is_valid():
                 data = {
                     'valid': True,
-                    'owner': {
-                        'id': str(invitation.owner.id),
-                        'username': invitation.owner.username,
-                        'avatar': invitation.owner.avatar,
-                        'bio': invitation.owner.bio
-                    },
+                    'owner': invitation.owner,
                     'created_at': invitation.created_at,
                     'expires_at': invitation.expires_at,
                     'remaining_uses': max(0, invitation.max_uses - invitation.uses_count)
@@ -125,26 +124,7 @@ class InvitationViewSet(viewsets.ModelViewSet):
         
         # Create or get direct room between users
         with transaction.atomic():
-            # Check if room already exists
-            existing_room = Room.objects.filter(
-                room_type='direct',
-                participants=request.user
-            ).filter(
-                participants=invitation.owner
-            ).first()
-            
-            if existing_room:
-                room = existing_room
-            else:
-                # Create new room
-                room = Room.objects.create(
-                    room_type='direct',
-                    created_by=invitation.owner
-                )
-                
-                # Add participants
-                RoomParticipant.objects.create(room=room, user=invitation.owner, role='member')
-                RoomParticipant.objects.create(room=room, user=request.user, role='member')
+            room, _ = Room.get_or_create_direct(invitation.owner, request.user)
             
             # Record invitation usage
             InvitationUsage.objects.create(
@@ -14,7 +14,7 @@ class RoomAdmin(admin.ModelAdmin):
 
 @admin.register(RoomParticipant)
 class RoomParticipantAdmin(admin.ModelAdmin):
-    list_display = ('room', 'user', 'role', 'joined_at', 'is_muted')
+    list_display = ('room', 'user', 'role', 'joined_at', 'unread_count', 'is_muted')
     list_filter = ('role', 'is_muted', 'joined_at')
     search_fields = ('room__name', 'user__username', 'user__email')
 
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import math
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.core.exceptions import ValidationError
+from config import ratelimit
+from user_accounts import presence
+from .models import Room
+from .presence_fanout import fanout, user_group_name
+from .renderers import BinaryJSONEncoder, to_wire
+from .serializers import KeyReused, SendMessageSerializer
+
+def room_group_name(room_id):
+    return f'chat_{room_id}'
+
+def broadcast_to_room(room_id, event):
+    """Fan an event out to every socket in the room (sync callers)"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(room_group_name(room_id), to_wire(event))
+
+class PresenceMixin:
+    """Online bookkeeping shared by every kind of socket a user holds open"""
+
+    async def join_presence(self):
+        if await sync_to_async(presence.connect)(self.user.id, self.channel_name):
+            fanout.record(self.user.id, is_online=True)
+        self.last_seen_saved = asyncio.get_running_loop().time()
+
+    async def leave_presence(self):
+        if await sync_to_async(presence.disconnect)(self.user.id, self.channel_name):
+            await database_sync_to_async(presence.save_last_seen)(self.user.id)
+            fanout.record(self.user.id, is_online=False)
+
+    async def heartbeat(self):
+        # A heartbeat after a lapse (a long suspend, say) brings the user back online
+        if await sync_to_async(presence.heartbeat)(self.user.id, self.channel_name):
+            fanout.record(self.user.id, is_online=True)
+
+        # last_seen is persisted on a slow schedule, not per heartbeat
+        now = asyncio.get_running_loop().time()
+        if now - self.last_seen_saved >= presence.LAST_SEEN_INTERVAL:
+            self.last_seen_saved = now
+            await database_sync_to_async(presence.save_last_seen)(self.user.id)
+
+class PresenceConsumer(PresenceMixin, AsyncJsonWebsocketConsumer):
+    """
+    App-wide socket for /ws/presence/, the only subscriber to a user's
+    presence diffs.
+
+    Clients hold one per tab, whatever page is showing, so a diff
+    arrives exactly once however many room sockets are open.
+    """
+
+    user = None
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            self.user = None
+            await self.close(code=4401)
+            return
+
+        await self.channel_layer.group_add(user_group_name(self.user.id), self.channel_name)
+        await self.accept()
+        await self.join_presence()
+
+    async def disconnect(self, code):
+        if self.user is None:
+            return
+
+        await self.channel_layer.group_discard(user_group_name(self.user.id), self.channel_name)
+        await self.leave_presence()
+
+    async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get('type') == 'heartbeat':
+            await self.heartbeat()
+        else:
+            await self.send_json({'type': 'error', 'errors': {'type': ['Unknown event type.']}})
+
+    async def presence_diff(self, event):
+        await self.send_json({'type': 'presence', 'changes': event['changes']})
+
+class ChatConsumer(PresenceMixin, AsyncJsonWebsocketConsumer):
+    """
+    Real-time chat socket for /ws/chat/<room_id>/.
+
+    Membership is checked once on connect; afterwards every frame is
+    trusted to belong to self.room.
+    """
+
+    room = None
+    # Set once the client sends a binary (msgpack) frame; replies follow suit
+    binary = False
+
+    # Typing state lives on the socket only. A burst of keystroke frames is
+    # announced once; later frames just push back the automatic stop sent
+    # TYPING_TIMEOUT seconds after the client goes quiet or disappears.
+    # Start and stop announcements are also spaced TYPING_MIN_INTERVAL
+    # apart, so flapping typing/stop_typing frames cost the room one.
+    TYPING_TIMEOUT = 5.0
+    TYPING_MIN_INTERVAL = 1.0
+    typing_task = None
+    typing_until = 0.0
+    last_typing_broadcast = -math.inf
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.room = await self.get_room(self.scope['url_route']['kwargs']['room_id'])
+        if self.room is None:
+            await self.close(code=4403)
+            return
+
+        self.group_name = room_group_name(self.room.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.join_presence()
+        await self.channel_layer.group_send(self.group_name, self.user_event('user_joined'))
+
+    async def disconnect(self, code):
+        if self.room is None:
+            return
+
+        await self.clear_typing(defer=False)
+        await self.channel_layer.group_send(self.group_name, self.user_event('user_left'))
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await self.leave_presence()
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None:
+            self.binary = True
+        try:
+            if bytes_data is not None:
+                content = msgpack.unpackb(bytes_data, raw=False)
+            else:
+                content = await self.decode_json(text_data)
+        except (msgpack.UnpackException, ValueError, TypeError):
+            content = None
+        # Bad input gets an error frame, never an exception that drops the socket
+        if not isinstance(content, dict):
+            await self.send_json({'type': 'error', 'errors': {'frame': ['Malformed frame.']}})
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(content), close=close)
+        else:
+            await super().send_json(content, close=close)
+
+    @classmethod
+    async def encode_json(cls, content):
+        return json.dumps(content, cls=BinaryJSONEncoder)
+
+    async def receive_json(self, content, **kwargs):
+        event_type = content.get('type')
+
+        if event_type == 'message':
+            if await self.throttled('message_send'):
+                return
+            message, replayed, errors = await self.save_message(content)
+            if errors:
+                await self.send_json({'type': 'error', 'errors': errors})
+                return
+            if replayed:
+                # Retried send: only the sender needs the stored copy as an ack
+                await self.send_json({'type': 'message', 'message': message})
+                return
+            await self.channel_layer.group_send(
+                self.group_name,
+                {'type': 'chat.message', 'message': message}
+            )
+            await self.clear_typing()
+        elif event_type == 'typing':
+            await self.set_typing()
+        elif event_type == 'stop_typing':
+            await self.clear_typing()
+        elif event_type == 'heartbeat':
+            await self.heartbeat()
+        else:
+            await self.send_json({'type': 'error', 'errors': {'type': ['Unknown event type.']}})
+
+    async def throttled(self, scope):
+        """Frame-level counterpart of the DRF throttles; rejects with a retry hint"""
+        wait = await ratelimit.limiter(scope).acheck(self.user.id)
+        if wait:
+            await self.send_json({
+                'type': 'error',
+                'errors': {'rate_limit': ['Too many messages.']},
+                'retry_after': math.ceil(wait),
+            })
+        return bool(wait)
+
+    def user_event(self, event_type):
+        return {
+            'type': 'chat.user_event',
+            'event': event_type,
+            'user_id': str(self.user.id),
+            'username': self.user.username,
+        }
+
+    # Typing indicators
+
+    async def set_typing(self):
+        now = asyncio.get_running_loop().time()
+        self.typing_until = now + self.TYPING_TIMEOUT
+        if self.typing_task is not None:
+            return  # Already announced
+        if now - self.last_typing_broadcast < self.TYPING_MIN_INTERVAL:
+            return  # Just announced a stop; a later frame restarts typing
+
+        self.typing_task = asyncio.create_task(self.expire_typing())
+        await self.broadcast_typing('typing')
+
+    async def clear_typing(self, defer=True):
+        if self.typing_task is None:
+            return  # Not typing: repeated stop frames are dropped here
+
+        settle_at = self.last_typing_broadcast + self.TYPING_MIN_INTERVAL
+        if defer and asyncio.get_running_loop().time() < settle_at:
+            # Too soon after the start: expire_typing sends the stop later,
+            # unless another typing frame arrives first and cancels it out
+            self.typing_until = settle_at
+            self.typing_task.cancel()
+            self.typing_task = asyncio.create_task(self.expire_typing())
+            return
+
+        self.typing_task.cancel()
+        self.typing_task = None
+        await self.broadcast_typing('stop_typing')
+
+    async def expire_typing(self):
+        loop = asyncio.get_running_loop()
+        while (remaining := self.typing_until - loop.time()) > 0:
+            await asyncio.sleep(remaining)
+
+        self.typing_task = None
+        await self.broadcast_typing('stop_typing')
+
+    async def broadcast_typing(self, event_type):
+        self.last_typing_broadcast = asyncio.get_running_loop().time()
+        await self.channel_layer.group_send(self.group_name, self.user_event(event_type))
+
+    # Channel layer handlers
+
+    async def chat_message(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+    async def chat_receipts(self, event):
+        await self.send_json({
+            'type': 'receipts',
+            'user_id': event['user_id'],
+            'receipts': event['receipts'],
+        })
+
+    async def chat_user_event(self, event):
+        await self.send_json({
+            'type': event['event'],
+            'user_id': event['user_id'],
+            'username': event['username'],
+        })
+
+    # Database access
+
+    @database_sync_to_async
+    def get_room(self, room_id):
+        try:
+            return Room.objects.get(id=room_id, participants=self.user, is_active=True)
+        except (Room.DoesNotExist, ValidationError):
+            return None
+
+    @database_sync_to_async
+    def save_message(self, content):
+        serializer = SendMessageSerializer(data=content)
+        if not serializer.is_valid():
+            return None, False, serializer.errors
+        try:
+            serializer.save(room=self.room, sender=self.user)
+        except KeyReused as exc:
+            return None, False, {'client_message_id': [str(exc.detail)]}
+        return to_wire(serializer.data), serializer.replayed, None
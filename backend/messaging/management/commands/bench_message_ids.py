@@ -0,0 +1,83 @@
+import time
+import uuid
+from django.db import DatabaseError, connection, transaction
+from config.benches import BenchCommand
+from config.ids import uuid7
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+class Command(BenchCommand):
+    help = (
+        'Compare sustained insert rate and primary key index size for '
+        'uuid4 and uuid7 keys on scratch tables in a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000)
+        parser.add_argument('--batch', type=int, default=1_000)
+        parser.add_argument('--payload', type=int, default=200, help='Bytes of filler per row')
+
+    def bench(self, *args, **options):
+        for name, generator in GENERATORS.items():
+            table = f'bench_ids_{name}'
+            self.create_table(table)
+            overall, tail = self.insert_rows(table, generator, options)
+            size = self.index_size(table)
+
+            size_text = f'{size / 1024 / 1024:.1f} MiB' if size is not None else 'n/a'
+            self.stdout.write(
+                f'{name}: {overall:,.0f} rows/s overall, '
+                f'{tail:,.0f} rows/s over the last 10%, pk index {size_text}'
+            )
+
+    def create_table(self, table):
+        quote = connection.ops.quote_name
+        id_type = connection.data_types['UUIDField']
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE {quote(table)} '
+                f'(id {id_type} NOT NULL PRIMARY KEY, payload TEXT NOT NULL)'
+            )
+
+    def insert_rows(self, table, generator, options):
+        rows, batch = options['rows'], options['batch']
+        payload = 'x' * options['payload']
+        sql = f'INSERT INTO {connection.ops.quote_name(table)} (id, payload) VALUES (%s, %s)'
+        tail_start = rows - rows // 10
+
+        started = time.perf_counter()
+        tail_started = started
+        for offset in range(0, rows, batch):
+            if offset >= tail_start and tail_started == started:
+                tail_started = time.perf_counter()
+            params = [(generator().hex, payload) for _ in range(min(batch, rows - offset))]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+        finished = time.perf_counter()
+
+        return rows / (finished - started), (rows - tail_start) / (finished - tail_started)
+
+    def index_size(self, table):
+        """Bytes used by the table's primary key index, if the backend can tell"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT pg_relation_size(indexrelid) FROM pg_index '
+                    'WHERE indrelid = %s::regclass AND indisprimary',
+                    [table]
+                )
+                return cursor.fetchone()[0]
+            if connection.vendor == 'sqlite':
+                try:
+                    cursor.execute(
+                        'SELECT SUM(pgsize) FROM dbstat WHERE name IN '
+                        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                        [table]
+                    )
+                except DatabaseError:
+                    return None  # SQLite built without the dbstat table
+                return cursor.fetchone()[0]
+        return None
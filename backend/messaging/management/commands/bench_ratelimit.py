@@ -0,0 +1,29 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from config.ratelimit import RateLimiter
+
+class Command(BaseCommand):
+    help = 'Measure the cost of one rate limit check with in-memory buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=1_000_000)
+        parser.add_argument('--keys', type=int, default=10_000, help='Distinct users being limited')
+
+    def handle(self, *args, **options):
+        keys = [uuid.uuid4() for _ in range(options['keys'])]
+        count = options['checks']
+        # Generous rate so the measured path is the common, allowed one
+        limiter = RateLimiter('bench', f'{count}/s', storage='memory')
+
+        started = time.perf_counter()
+        for i in range(count):
+            pass
+        loop = time.perf_counter() - started
+
+        check = limiter.check
+        started = time.perf_counter()
+        for i in range(count):
+            check(keys[i % len(keys)])
+        elapsed = time.perf_counter() - started - loop
+        self.stdout.write(f'{elapsed / count * 1e9:,.0f} ns per check over {len(keys):,} keys')
@@ -0,0 +1,67 @@
+import base64
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from config.benches import BenchCommand
+from messaging.models import Room
+from messaging.serializers import SendMessageSerializer
+
+User = get_user_model()
+
+class Command(BenchCommand):
+    help = (
+        'Measure messages per second sent concurrently into one group room, '
+        'with and without the old per-message Room.updated_at write'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=8)
+        parser.add_argument('--messages', type=int, default=200, help='Messages per sender')
+
+    def bench(self, *args, **options):
+        stamp = int(time.time() * 1000)
+        users = [
+            User.objects.create_user(
+                username=f'bench-{stamp}-{i}', email=f'bench-{stamp}-{i}@example.invalid'
+            )
+            for i in range(options['senders'])
+        ]
+        for label, touch_room in (('room row write per message', True), ('derived activity', False)):
+            rate, errors = self.run(users, options['messages'], touch_room)
+            self.stdout.write(f'{label}: {rate:,.0f} msg/s ({errors} failed sends)')
+
+    def run(self, users, per_sender, touch_room):
+        room = Room.objects.create(room_type='group', name='send benchmark')
+        room.add_participants(users)
+        payload = {
+            'ciphertext': base64.b64encode(b'x' * 64).decode(),
+            'nonce': base64.b64encode(b'n' * 12).decode(),
+        }
+        errors = []
+
+        def sender(user):
+            own_room = Room.objects.get(id=room.id)
+            try:
+                for _ in range(per_sender):
+                    serializer = SendMessageSerializer(data=payload)
+                    serializer.is_valid(raise_exception=True)
+                    try:
+                        serializer.save(room=own_room, sender=user)
+                        if touch_room:
+                            own_room.save(update_fields=['updated_at'])
+                    except OperationalError:
+                        errors.append(user.id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sender, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        sent = len(users) * per_sender - len(errors)
+        return sent / elapsed, len(errors)
@@ -0,0 +1,90 @@
+import asyncio
+import statistics
+import time
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from config.benches import BenchCommand
+from messaging.models import Room
+from messaging.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+class Command(BenchCommand):
+    help = (
+        'Measure message delivery latency in a large group over in-process '
+        'sockets, quiet and during a typing storm'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=500)
+        parser.add_argument('--typists', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--keystroke-ms', type=int, default=100, help='Typing frame interval per typist')
+
+    def bench(self, *args, **options):
+        stamp = int(time.time() * 1000)
+        users = [
+            User.objects.create_user(
+                username=f'bench-{stamp}-{i}', email=f'bench-{stamp}-{i}@example.invalid'
+            )
+            for i in range(options['members'])
+        ]
+        room = Room.objects.create(room_type='group', name='typing benchmark')
+        room.add_participants(users)
+        asyncio.run(self.measure(users, room, options))
+
+    async def measure(self, users, room, options):
+        application = URLRouter(websocket_urlpatterns)
+        sockets = []
+        for user in users:
+            socket = WebsocketCommunicator(application, f'/ws/chat/{room.id}/')
+            socket.scope['user'] = user
+            await socket.connect()
+            sockets.append(socket)
+        sender, receiver = sockets[0], sockets[-1]
+        typists = sockets[1:1 + options['typists']]
+
+        try:
+            quiet, _ = await self.deliver(sender, receiver, options['messages'])
+
+            frames = [0]
+            storm = [asyncio.create_task(self.type(socket, options['keystroke_ms'], frames)) for socket in typists]
+            stormy, typing_seen = await self.deliver(sender, receiver, options['messages'])
+            for task in storm:
+                task.cancel()
+        finally:
+            await asyncio.gather(*(socket.disconnect() for socket in sockets))
+
+        self.stdout.write(f'{len(users)} members, {len(typists)} typists')
+        self.stdout.write(self.summary('quiet', quiet))
+        self.stdout.write(self.summary('typing storm', stormy))
+        self.stdout.write(
+            f'typing frames sent: {frames[0]:,}, typing broadcasts seen by one member: {typing_seen:,}'
+        )
+
+    async def type(self, socket, interval_ms, frames):
+        while True:
+            await socket.send_json_to({'type': 'typing'})
+            frames[0] += 1
+            await asyncio.sleep(interval_ms / 1000)
+
+    async def deliver(self, sender, receiver, count):
+        """Send messages one at a time and time each until the receiver has it"""
+        latencies, typing_seen = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            await sender.send_json_to({'type': 'message', 'ciphertext': 'YmVuY2g=', 'nonce': 'bg=='})
+            while True:
+                event = await receiver.receive_json_from(timeout=30)
+                if event['type'] == 'typing':
+                    typing_seen += 1
+                if event['type'] == 'message':
+                    break
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies, typing_seen
+
+    def summary(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        return f'{label}: p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms'
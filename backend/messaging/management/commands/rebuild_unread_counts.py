@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from messaging.models import RoomParticipant
+
+class Command(BaseCommand):
+    help = 'Rebuild RoomParticipant.unread_count from messages and verify it against the slow path'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify the stored counters; exit non-zero on mismatch'
+        )
+    
+    def handle(self, *args, **options):
+        if not options['check']:
+            updated = RoomParticipant.rebuild_unread_counts()
+            self.stdout.write(f'Rebuilt unread counters for {updated} participants')
+        
+        mismatches = 0
+        participants = RoomParticipant.objects.only(
+            'id', 'room_id', 'user_id', 'last_read_at', 'unread_count'
+        )
+        for participant in participants.iterator(chunk_size=2000):
+            expected = participant.count_unread_messages()
+            if participant.unread_count != expected:
+                mismatches += 1
+                self.stderr.write(
+                    f'Participant {participant.id}: stored {participant.unread_count}, '
+                    f'expected {expected}'
+                )
+        
+        if mismatches:
+            raise CommandError(f'{mismatches} unread counters are out of date')
+        self.stdout.write(self.style.SUCCESS('All unread counters verified'))
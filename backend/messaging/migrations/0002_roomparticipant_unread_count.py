@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:56
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_messages(queryset):
+    counts = queryset.order_by().values('room').annotate(total=models.Count('pk')).values('total')
+    return Coalesce(models.Subquery(counts[:1]), 0)
+
+
+def backfill_unread_counts(apps, schema_editor):
+    Message = apps.get_model('messaging', 'Message')
+    RoomParticipant = apps.get_model('messaging', 'RoomParticipant')
+    others = Message.objects.filter(
+        room=models.OuterRef('room')
+    ).exclude(sender=models.OuterRef('user'))
+    RoomParticipant.objects.update(unread_count=models.Case(
+        models.When(last_read_at__isnull=True, then=count_messages(others)),
+        default=count_messages(
+            others.filter(created_at__gt=models.OuterRef('last_read_at'))
+        ),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_roomparticipant_unread_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change_type', models.CharField(choices=[('message', 'Message Sent'), ('message_edited', 'Message Edited'), ('message_deleted', 'Message Deleted'), ('member_joined', 'Member Joined'), ('member_left', 'Member Left'), ('read', 'Read Watermark Moved')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='messaging.message')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='messaging.room')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'room_changes',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['room', 'id'], name='room_change_room_id_77de2d_idx'), models.Index(fields=['user', 'id'], name='room_change_user_id_d10d4b_idx')],
+            },
+        ),
+    ]
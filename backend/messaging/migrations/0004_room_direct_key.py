@@ -0,0 +1,81 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:02
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_messages(queryset):
+    counts = queryset.order_by().values('room').annotate(total=models.Count('pk')).values('total')
+    return Coalesce(models.Subquery(counts[:1]), 0)
+
+
+def backfill_direct_keys(apps, schema_editor):
+    """Key every two-person direct room, merging duplicates into the oldest"""
+    Room = apps.get_model('messaging', 'Room')
+    RoomParticipant = apps.get_model('messaging', 'RoomParticipant')
+    Message = apps.get_model('messaging', 'Message')
+    RoomChange = apps.get_model('messaging', 'RoomChange')
+    InvitationUsage = apps.get_model('invitations', 'InvitationUsage')
+    VideoCall = apps.get_model('video_calls', 'VideoCall')
+
+    members = defaultdict(list)
+    for room_id, user_id in RoomParticipant.objects.filter(
+        room__room_type='direct'
+    ).values_list('room_id', 'user_id'):
+        members[room_id].append(str(user_id))
+
+    rooms_by_key = defaultdict(list)
+    for room_id, user_ids in members.items():
+        if len(user_ids) == 2:
+            low, high = sorted(user_ids)
+            rooms_by_key[f'{low}:{high}'].append(room_id)
+
+    for key, room_ids in rooms_by_key.items():
+        rooms = list(Room.objects.filter(id__in=room_ids).order_by('created_at'))
+        keeper, duplicate_ids = rooms[0], [room.id for room in rooms[1:]]
+
+        if duplicate_ids:
+            for model in (Message, RoomChange, InvitationUsage, VideoCall):
+                model.objects.filter(room_id__in=duplicate_ids).update(room=keeper)
+
+            # Keep each user's furthest read watermark across the copies
+            for participant in RoomParticipant.objects.filter(room=keeper):
+                latest = RoomParticipant.objects.filter(
+                    room_id__in=duplicate_ids + [keeper.id],
+                    user_id=participant.user_id
+                ).aggregate(latest=models.Max('last_read_at'))['latest']
+                RoomParticipant.objects.filter(id=participant.id).update(last_read_at=latest)
+
+            Room.objects.filter(id__in=duplicate_ids).delete()
+
+            others = Message.objects.filter(
+                room=models.OuterRef('room')
+            ).exclude(sender=models.OuterRef('user'))
+            RoomParticipant.objects.filter(room=keeper).update(unread_count=models.Case(
+                models.When(last_read_at__isnull=True, then=count_messages(others)),
+                default=count_messages(
+                    others.filter(created_at__gt=models.OuterRef('last_read_at'))
+                ),
+            ))
+
+        Room.objects.filter(id=keeper.id).update(direct_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_roomchange'),
+        ('invitations', '0001_initial'),
+        ('video_calls', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='direct_key',
+            field=models.CharField(blank=True, editable=False, max_length=80, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Expand step of the text -> binary ciphertext switch: nullable binary
+    columns next to the base64 text ones. 0008 backfills them and 0009
+    swaps them in, so no step rewrites the table while holding locks.
+    """
+
+    dependencies = [
+        ('messaging', '0005_alter_message_id_alter_room_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='ciphertext_bin',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='nonce_bin',
+            field=models.BinaryField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='tag_bin',
+            field=models.BinaryField(max_length=32, null=True),
+        ),
+    ]
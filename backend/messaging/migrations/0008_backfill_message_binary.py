@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:25
+
+import base64
+import binascii
+
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 1000
+
+
+def decode(value):
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        # Not base64: keep the original text rather than losing it
+        return value.encode('utf-8')
+
+
+def convert_to_binary(apps, schema_editor):
+    """Decode base64 text into the binary columns, one short transaction per chunk"""
+    Message = apps.get_model('messaging', 'Message')
+    pending = Message.objects.filter(ciphertext_bin__isnull=True).order_by('pk')
+    last_pk = None
+
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        rows = list(chunk.only('pk', 'ciphertext', 'nonce', 'tag')[:CHUNK_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.ciphertext_bin = decode(row.ciphertext)
+            row.nonce_bin = decode(row.nonce)
+            row.tag_bin = decode(row.tag)
+        with transaction.atomic():
+            Message.objects.bulk_update(rows, ['ciphertext_bin', 'nonce_bin', 'tag_bin'])
+        last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Each chunk commits on its own so no long-running lock is held
+    atomic = False
+
+    dependencies = [
+        ('messaging', '0007_message_client_message_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_to_binary, migrations.RunPython.noop),
+    ]
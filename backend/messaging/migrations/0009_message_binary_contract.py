@@ -0,0 +1,75 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:30
+
+import base64
+import binascii
+
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 1000
+
+
+def decode(value):
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        # Not base64: keep the original text rather than losing it
+        return value.encode('utf-8')
+
+
+def convert_to_binary(apps, schema_editor):
+    """Decode base64 text into the binary columns, one short transaction per chunk"""
+    Message = apps.get_model('messaging', 'Message')
+    pending = Message.objects.filter(ciphertext_bin__isnull=True).order_by('pk')
+    last_pk = None
+
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        rows = list(chunk.only('pk', 'ciphertext', 'nonce', 'tag')[:CHUNK_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.ciphertext_bin = decode(row.ciphertext)
+            row.nonce_bin = decode(row.nonce)
+            row.tag_bin = decode(row.tag)
+        with transaction.atomic():
+            Message.objects.bulk_update(rows, ['ciphertext_bin', 'nonce_bin', 'tag_bin'])
+        last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+    """
+    Contract step: swap the binary columns in for the text ones.
+
+    Rows written as base64 text after 0008 ran (by servers still on the
+    old code) are converted first, so the drop loses nothing and the
+    NOT NULL holds.
+    """
+
+    dependencies = [
+        ('messaging', '0008_backfill_message_binary'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_to_binary, migrations.RunPython.noop),
+        migrations.RemoveField(model_name='message', name='ciphertext'),
+        migrations.RemoveField(model_name='message', name='nonce'),
+        migrations.RemoveField(model_name='message', name='tag'),
+        migrations.RenameField(model_name='message', old_name='ciphertext_bin', new_name='ciphertext'),
+        migrations.RenameField(model_name='message', old_name='nonce_bin', new_name='nonce'),
+        migrations.RenameField(model_name='message', old_name='tag_bin', new_name='tag'),
+        migrations.AlterField(
+            model_name='message',
+            name='ciphertext',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='nonce',
+            field=models.BinaryField(max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='tag',
+            field=models.BinaryField(blank=True, default=b'', max_length=32),
+        ),
+    ]
@@ -1,7 +1,15 @@
-import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from config.ids import uuid7
+
+def subquery_count(queryset, group_by='room'):
+    """Correlated COUNT(*) usable as a per-row annotation or update value"""
+    counts = queryset.order_by().values(group_by).annotate(
+        total=models.Count('pk')
+    ).values('total')
+    return Coalesce(models.Subquery(counts[:1]), 0)
 
 class Room(models.Model):
     ROOM_TYPES = (
@@ -9,7 +17,7 @@ class Room(models.Model):
         ('group', 'Group Chat'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=100, blank=True, null=True)
     room_type = models.CharField(max_length=10, choices=ROOM_TYPES, default='direct')
     participants = models.ManyToManyField(
@@ -23,6 +31,8 @@ class Room(models.Model):
         null=True,
         related_name='created_rooms'
     )
+    # Order-independent "<low id>:<high id>" of a direct room's two users
+    direct_key = models.CharField(max_length=80, unique=True, null=True, blank=True, editable=False)
     avatar = models.URLField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
@@ -45,17 +55,46 @@ class Room(models.Model):
     def get_last_message(self):
         return self.messages.first()
     
+    @staticmethod
+    def make_direct_key(user_a, user_b):
+        low, high = sorted([str(user_a.pk), str(user_b.pk)])
+        return f'{low}:{high}'
+    
+    @classmethod
+    def get_or_create_direct(cls, user, other_user):
+        """
+        Find or atomically create the direct room for a pair of users.
+
+        Lookup is a single probe on the unique direct_key index; a
+        concurrent creator loses the insert race and fetches the winner.
+        """
+        key = cls.make_direct_key(user, other_user)
+        room = cls.objects.filter(direct_key=key).first()
+        if room:
+            return room, False
+        
+        try:
+            with transaction.atomic():
+                room = cls.objects.create(room_type='direct', direct_key=key, created_by=user)
+                room.add_participants([user, other_user])
+        except IntegrityError:
+            return cls.objects.get(direct_key=key), False
+        return room, True
+    
+    def add_participants(self, users, role='member'):
+        """Add users to the room and log the membership changes"""
+        RoomParticipant.objects.bulk_create([
+            RoomParticipant(room=self, user=user, role=role) for user in users
+        ])
+        RoomChange.objects.bulk_create([
+            RoomChange(room=self, user=user, change_type='member_joined') for user in users
+        ])
+    
     def get_unread_count(self, user):
-        last_read = RoomParticipant.objects.filter(
+        participant = RoomParticipant.objects.filter(
             room=self, user=user
         ).first()
-        
-        if not last_read or not last_read.last_read_at:
-            return self.messages.count()
-        
-        return self.messages.filter(
-            created_at__gt=last_read.last_read_at
-        ).exclude(sender=user).count()
+        return participant.unread_count if participant else 0
 
 class RoomParticipant(models.Model):
     ROLES = (
@@ -69,6 +108,7 @@ class RoomParticipant(models.Model):
     role = models.CharField(max_length=10, choices=ROLES, default='member')
     joined_at = models.DateTimeField(auto_now_add=True)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
     is_muted = models.BooleanField(default=False)
     
     class Meta:
@@ -77,7 +117,61 @@ class RoomParticipant(models.Model):
     
     def mark_as_read(self):
         self.last_read_at = timezone.now()
-        self.save(update_fields=['last_read_at'])
+        self.unread_count = 0
+        self.save(update_fields=['last_read_at', 'unread_count'])
+        RoomChange.objects.create(room_id=self.room_id, user_id=self.user_id, change_type='read')
+    
+    def count_unread_messages(self):
+        """Slow path: count the unread tail instead of using unread_count"""
+        messages = Message.objects.filter(room_id=self.room_id).exclude(sender_id=self.user_id)
+        if self.last_read_at:
+            messages = messages.filter(created_at__gt=self.last_read_at)
+        return messages.count()
+    
+    @classmethod
+    def read_watermarks(cls, room_ids):
+        """Map room id -> [(user_id, username, last_read_at)] in one query"""
+        watermarks = {room_id: [] for room_id in room_ids}
+        rows = cls.objects.filter(
+            room_id__in=room_ids,
+            last_read_at__isnull=False
+        ).values_list('room_id', 'user_id', 'user__username', 'last_read_at')
+        for room_id, user_id, username, last_read_at in rows:
+            watermarks[room_id].append((user_id, username, last_read_at))
+        return watermarks
+    
+    @classmethod
+    def advance_read_watermark(cls, room_id, user, read_at):
+        """Move last_read_at forward (never back) and refresh unread_count"""
+        participant = cls.objects.filter(room_id=room_id, user=user)
+        updated = participant.filter(
+            models.Q(last_read_at__isnull=True) | models.Q(last_read_at__lt=read_at)
+        ).update(last_read_at=read_at)
+        if updated:
+            cls.rebuild_unread_counts(participant)
+            RoomChange.objects.create(room_id=room_id, user=user, change_type='read')
+        return bool(updated)
+    
+    @classmethod
+    def rebuild_unread_counts(cls, queryset=None):
+        """Recompute unread_count from the message table in one UPDATE"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        others = Message.objects.filter(
+            room=models.OuterRef('room')
+        ).exclude(sender=models.OuterRef('user'))
+        return queryset.update(unread_count=models.Case(
+            models.When(last_read_at__isnull=True, then=subquery_count(others)),
+            default=subquery_count(
+                others.filter(created_at__gt=models.OuterRef('last_read_at'))
+            ),
+        ))
+    
+    @classmethod
+    def increment_unread(cls, room, sender, count=1):
+        """Bump every other participant's counter in a single UPDATE"""
+        cls.objects.filter(room=room).exclude(user=sender).update(
+            unread_count=models.F('unread_count') + count
+        )
 
 class Message(models.Model):
     MESSAGE_TYPES = (
@@ -90,15 +184,17 @@ class Message(models.Model):
         ('system', 'System'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text')
+    # Optional client-generated key; a retried send returns the stored message
+    client_message_id = models.CharField(max_length=64, null=True, blank=True, editable=False)
     
-    # Encrypted message content
-    ciphertext = models.TextField()
-    nonce = models.CharField(max_length=64)
-    tag = models.CharField(max_length=64, blank=True)
+    # Encrypted message content, stored as raw bytes
+    ciphertext = models.BinaryField()
+    nonce = models.BinaryField(max_length=32)
+    tag = models.BinaryField(max_length=32, blank=True, default=b'')
     
     # File attachments
     file_url = models.URLField(blank=True, null=True)
@@ -122,6 +218,13 @@ class Message(models.Model):
             models.Index(fields=['room', '-created_at']),
             models.Index(fields=['sender', '-created_at']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sender', 'client_message_id'],
+                condition=models.Q(client_message_id__isnull=False),
+                name='unique_sender_client_message_id',
+            ),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} in {self.room}"
@@ -133,12 +236,21 @@ class Message(models.Model):
         return self.edited_at is not None
 
 class MessageStatus(models.Model):
+    """
+    Per-message receipt, for states that need per-message granularity.
+
+    "Read" is normally derived from RoomParticipant.last_read_at instead
+    of storing one row per message per reader.
+    """
     MESSAGE_STATUS_CHOICES = (
         ('sent', 'Sent'),
         ('delivered', 'Delivered'),
         ('read', 'Read'),
     )
     
+    # Receipts only ever move forward along this order
+    STATUS_RANK = {'sent': 0, 'delivered': 1, 'read': 2}
+    
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='statuses')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=MESSAGE_STATUS_CHOICES)
@@ -150,3 +262,36 @@ class MessageStatus(models.Model):
         indexes = [
             models.Index(fields=['message', 'status']),
         ]
+
+class RoomChange(models.Model):
+    """
+    Append-only log of everything a reconnecting client must replay.
+
+    The auto-increment id is the sync cursor, so a sync reads only the
+    rows after it via the (room, id) index.
+    """
+    CHANGE_TYPES = (
+        ('message', 'Message Sent'),
+        ('message_edited', 'Message Edited'),
+        ('message_deleted', 'Message Deleted'),
+        ('member_joined', 'Member Joined'),
+        ('member_left', 'Member Left'),
+        ('read', 'Read Watermark Moved'),
+    )
+    
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='changes')
+    change_type = models.CharField(max_length=20, choices=CHANGE_TYPES)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'room_changes'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['room', 'id']),
+            models.Index(fields=['user', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.change_type} in {self.room_id} (#{self.id})"
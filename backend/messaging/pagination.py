@@ -0,0 +1,122 @@
+import base64
+import binascii
+import uuid
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, id), newest first.
+
+    ``before=<cursor>`` pages towards older messages and ``after=<cursor>``
+    towards newer ones. Each page is a seek on the (room, -created_at)
+    index, so it costs the same however deep the client scrolls: no
+    OFFSET and no COUNT(*).
+    """
+
+    default_limit = 50
+    max_limit = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.direction = 'after' if 'after' in request.query_params else 'before'
+        cursor = request.query_params.get(self.direction)
+
+        if cursor is not None:
+            created_at, pk = self.decode_cursor(cursor)
+            if self.direction == 'before':
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                )
+
+        if self.direction == 'before':
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            queryset = queryset.order_by('created_at', 'id')
+
+        # Fetch one extra row to learn whether another page exists
+        results = list(queryset[:self.limit + 1])
+        self.has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if self.direction == 'after':
+            results.reverse()
+
+        self.has_cursor = cursor is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_next_link(self):
+        """Link to the page of older messages"""
+        if not self.page:
+            return None
+        if self.direction == 'before' and not self.has_more:
+            return None
+        return self.build_link('before', self.page[-1])
+
+    def get_previous_link(self):
+        """Link to the page of newer messages"""
+        if not self.page:
+            return None
+        if self.direction == 'after' and not self.has_more:
+            return None
+        if self.direction == 'before' and not self.has_cursor:
+            return None
+        return self.build_link('after', self.page[0])
+
+    def build_link(self, param, message):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'before')
+        url = remove_query_param(url, 'after')
+        return replace_query_param(url, param, self.encode_cursor(message))
+
+    def encode_cursor(self, message):
+        raw = f'{message.created_at.isoformat()}|{message.id}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+            created_at, pk = raw.split('|')
+            created_at = parse_datetime(created_at)
+            pk = uuid.UUID(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
@@ -0,0 +1,99 @@
+"""
+Delivery of presence changes to the people allowed to see them.
+
+Online/offline flips are buffered per process and flushed every
+FLUSH_INTERVAL seconds. A flush computes the audience for all changed
+users in a few bulk queries and sends each watcher one diff with every
+change it may see. A watcher is someone who has the user as a contact
+or shares an active room with them. Audiences respect the user's
+show_last_seen setting and their blocks. Diffs go to the watcher's user
+group, which only their /ws/presence/ sockets join.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+from user_accounts import contact_graph
+from user_accounts.models import User
+from .models import RoomParticipant
+from .renderers import to_wire
+
+FLUSH_INTERVAL = 3.0
+
+logger = logging.getLogger(__name__)
+
+def user_group_name(user_id):
+    return f'user_{user_id}'
+
+def presence_audiences(user_ids):
+    """Map each user id to the set of user ids allowed to see their presence"""
+    visibility = dict(User.objects.filter(id__in=user_ids).values_list('id', 'show_last_seen'))
+    user_ids = [user_id for user_id, setting in visibility.items() if setting != 'nobody']
+    if not user_ids:
+        return {}
+
+    contacts = contact_graph.graphs(user_ids)
+    watchers = {user_id: set(contacts[user_id]['contacted_by']) for user_id in user_ids}
+    for user_id, peer_id in RoomParticipant.objects.filter(
+        user_id__in=user_ids, room__is_active=True
+    ).values_list('user_id', 'room__roomparticipant__user_id'):
+        watchers[user_id].add(peer_id)
+
+    audiences = {}
+    for user_id in user_ids:
+        audience = watchers[user_id] - contacts[user_id]['blocked'] - {user_id}
+        if visibility[user_id] == 'contacts':
+            audience &= contacts[user_id]['contacts']
+        audiences[user_id] = audience
+    return audiences
+
+def build_diffs(changes):
+    """Per-watcher lists of the changes each one may see"""
+    diffs = defaultdict(list)
+    for user_id, audience in presence_audiences(list(changes)).items():
+        for watcher_id in audience:
+            diffs[watcher_id].append(changes[user_id])
+    return diffs
+
+class PresenceFanout:
+    def __init__(self):
+        self.pending = {}
+        self.task = None
+
+    def record(self, user_id, is_online):
+        """Queue a flip; later flips for the same user replace earlier ones"""
+        self.pending[user_id] = {
+            'user_id': user_id,
+            'is_online': is_online,
+            'last_seen': None if is_online else timezone.now(),
+        }
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        changes, self.pending = self.pending, {}
+        if not changes:
+            return
+
+        try:
+            diffs = await database_sync_to_async(build_diffs)(changes)
+            channel_layer = get_channel_layer()
+            for watcher_id, watcher_changes in diffs.items():
+                await channel_layer.group_send(
+                    user_group_name(watcher_id),
+                    to_wire({'type': 'presence.diff', 'changes': watcher_changes})
+                )
+        except Exception:
+            # Keep the batch for the next flush, behind any newer flips
+            logger.exception('Presence flush failed for %d users', len(changes))
+            self.pending = {**changes, **self.pending}
+
+fanout = PresenceFanout()
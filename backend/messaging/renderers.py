@@ -0,0 +1,44 @@
+import base64
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+def to_wire(data):
+    """
+    Coerce serializer output to types both JSON and msgpack can carry.
+
+    UUIDs, datetimes and the like become strings; bytes stay bytes so
+    binary frames can ship them without base64.
+    """
+    if isinstance(data, dict):
+        return {key: to_wire(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [to_wire(value) for value in data]
+    if isinstance(data, memoryview):
+        return bytes(data)
+    if data is None or isinstance(data, (str, bytes, int, float)):
+        return data
+    return DjangoJSONEncoder().default(data)
+
+class BinaryJSONEncoder(JSONEncoder):
+    """DRF's encoder, with raw bytes written as standard base64 text"""
+    def default(self, obj):
+        if isinstance(obj, (bytes, memoryview)):
+            return base64.b64encode(obj).decode('ascii')
+        return super().default(obj)
+
+class BinaryJSONRenderer(JSONRenderer):
+    encoder_class = BinaryJSONEncoder
+
+class MessagePackRenderer(BaseRenderer):
+    """Compact binary framing: bytes fields are sent as raw msgpack bin"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(to_wire(data))
@@ -0,0 +1,7 @@
+from django.urls import re_path
+from .consumers import ChatConsumer, PresenceConsumer
+
+websocket_urlpatterns = [
+    re_path(r'^ws/chat/(?P<room_id>[0-9a-fA-F-]+)/$', ChatConsumer.as_asgi()),
+    re_path(r'^ws/presence/$', PresenceConsumer.as_asgi()),
+]
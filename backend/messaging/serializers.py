@@ -1,7 +1,12 @@
-from rest_framework import serializers
+import base64
+import binascii
+from collections import Counter
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
 from django.contrib.auth import get_user_model
-from user_accounts.serializers import UserPublicSerializer
-from .models import Room, Message, RoomParticipant, MessageStatus
+from django.db import IntegrityError, transaction
+from user_accounts.serializers import UserPublicSerializer, prime_presence
+from .models import Room, Message, RoomParticipant, MessageStatus, RoomChange
 
 User = get_user_model()
 
@@ -12,20 +17,71 @@ class RoomParticipantSerializer(serializers.ModelSerializer):
         model = RoomParticipant
         fields = ['user', 'role', 'joined_at', 'last_read_at', 'is_muted']
 
+class BinaryField(serializers.Field):
+    """
+    Raw bytes in Python and the database.
+
+    Accepts base64 text (JSON clients) or bytes (msgpack clients) and
+    returns bytes, which the renderer encodes for the chosen format.
+    """
+    default_error_messages = {
+        'invalid': 'Expected base64-encoded text or binary data.',
+        'max_length': 'Ensure this value has at most {max_length} bytes.',
+    }
+    
+    def __init__(self, max_length=None, **kwargs):
+        self.max_length = max_length
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            value = bytes(data)
+        elif isinstance(data, str):
+            try:
+                value = base64.b64decode(data, validate=True)
+            except (binascii.Error, ValueError):
+                self.fail('invalid')
+        else:
+            self.fail('invalid')
+        
+        if self.max_length is not None and len(value) > self.max_length:
+            self.fail('max_length', max_length=self.max_length)
+        return value
+    
+    def to_representation(self, value):
+        return bytes(value)
+
+class MessageListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Load read watermarks for every room on the page up front so each
+        # message's read_by is computed without further queries.
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        watermarks = self.context.setdefault('read_watermarks', {})
+        missing = {message.room_id for message in messages} - watermarks.keys()
+        if missing:
+            watermarks.update(RoomParticipant.read_watermarks(missing))
+        if 'online_user_ids' not in self.context:
+            prime_presence(self.context, {message.sender_id for message in messages})
+        return super().to_representation(messages)
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserPublicSerializer(read_only=True)
+    ciphertext = BinaryField()
+    nonce = BinaryField(max_length=32)
+    tag = BinaryField(max_length=32, required=False)
     reply_to = serializers.SerializerMethodField()
     read_by = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = [
-            'id', 'sender', 'message_type', 'ciphertext', 'nonce', 'tag',
+            'id', 'client_message_id', 'sender', 'message_type', 'ciphertext', 'nonce', 'tag',
             'file_url', 'file_name', 'file_size', 'file_type',
             'reply_to', 'forwarded_from', 'edited_at', 'deleted_at',
             'created_at', 'read_by'
         ]
         read_only_fields = ['id', 'sender', 'created_at']
+        list_serializer_class = MessageListSerializer
     
     def get_reply_to(self, obj):
         if obj.reply_to:
@@ -38,30 +94,71 @@ class MessageSerializer(serializers.ModelSerializer):
         return None
     
     def get_read_by(self, obj):
-        # Return list of users who have read this message
-        read_statuses = obj.statuses.filter(status='read')
-        return [status.user.username for status in read_statuses]
+        # Users whose read watermark has passed this message
+        watermarks = self.context.get('read_watermarks', {})
+        if obj.room_id not in watermarks:
+            watermarks = RoomParticipant.read_watermarks([obj.room_id])
+        return [
+            username
+            for user_id, username, last_read_at in watermarks[obj.room_id]
+            if user_id != obj.sender_id and last_read_at >= obj.created_at
+        ]
 
 class RoomSerializer(serializers.ModelSerializer):
     participants = RoomParticipantSerializer(source='roomparticipant_set', many=True, read_only=True)
-    last_message = MessageSerializer(source='get_last_message', read_only=True)
+    last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
-    participant_count = serializers.IntegerField(source='participants.count', read_only=True)
+    participant_count = serializers.SerializerMethodField()
+    last_activity_at = serializers.SerializerMethodField()
     
     class Meta:
         model = Room
         fields = [
             'id', 'name', 'room_type', 'avatar', 'description',
             'participants', 'participant_count', 'last_message',
-            'unread_count', 'is_active', 'created_at', 'updated_at'
+            'unread_count', 'is_active', 'created_at', 'updated_at',
+            'last_activity_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
     
+    # RoomViewSet annotates the inbox fields; other callers fall back to
+    # the per-room queries on the model.
+    
+    def get_last_message(self, obj):
+        if hasattr(obj, 'last_message'):
+            message = obj.last_message
+        else:
+            message = obj.get_last_message()
+        if message is None:
+            return None
+        # Participants are prefetched, so their watermarks cost no query
+        watermarks = {obj.id: [
+            (p.user_id, p.user.username, p.last_read_at)
+            for p in obj.roomparticipant_set.all() if p.last_read_at
+        ]}
+        context = {**self.context, 'read_watermarks': watermarks}
+        return MessageSerializer(message, context=context).data
+    
     def get_unread_count(self, obj):
+        if hasattr(obj, 'annotated_unread_count'):
+            return obj.annotated_unread_count
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.get_unread_count(request.user)
         return 0
+    
+    def get_participant_count(self, obj):
+        if hasattr(obj, 'annotated_participant_count'):
+            return obj.annotated_participant_count
+        return obj.participants.count()
+    
+    def get_last_activity_at(self, obj):
+        if hasattr(obj, 'last_activity_at'):
+            activity = obj.last_activity_at
+        else:
+            message = obj.get_last_message()
+            activity = message.created_at if message else obj.created_at
+        return serializers.DateTimeField().to_representation(activity)
 
 class CreateDirectRoomSerializer(serializers.Serializer):
     user_id = serializers.UUIDField()
@@ -79,15 +176,164 @@ class CreateDirectRoomSerializer(serializers.Serializer):
         
         return value
 
+class KeyReused(APIException):
+    """An idempotency key sent again for a different room"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This client_message_id was already used in another room.'
+    default_code = 'key_reused'
+
+def replay(stored, room_id):
+    """The stored message for a retried send, provided it went to the same room"""
+    if stored.room_id != room_id:
+        raise KeyReused()
+    return stored
+
+def stored_messages(sender, client_message_ids):
+    """Messages this sender already stored under the given idempotency keys"""
+    if not client_message_ids:
+        return {}
+    return {
+        message.client_message_id: message
+        for message in Message.objects.select_related('sender', 'reply_to__sender').filter(
+            sender=sender, client_message_id__in=client_message_ids
+        )
+    }
+
 class SendMessageSerializer(serializers.Serializer):
     message_type = serializers.ChoiceField(choices=Message.MESSAGE_TYPES, default='text')
-    ciphertext = serializers.CharField()
-    nonce = serializers.CharField(max_length=64)
-    tag = serializers.CharField(max_length=64, required=False, allow_blank=True)
+    ciphertext = BinaryField()
+    nonce = BinaryField(max_length=32)
+    tag = BinaryField(max_length=32, required=False)
     reply_to_id = serializers.UUIDField(required=False, allow_null=True)
+    client_message_id = serializers.CharField(max_length=64, required=False, allow_null=True)
     
     # File upload fields
     file_url = serializers.URLField(required=False, allow_blank=True)
     file_name = serializers.CharField(max_length=255, required=False, allow_blank=True)
     file_size = serializers.IntegerField(required=False, allow_null=True)
     file_type = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
+    # Set by save(): True when a retry returned the message stored earlier
+    replayed = False
+    
+    def create(self, validated_data):
+        """Persist a message; callers pass room and sender to save()"""
+        room, sender = validated_data['room'], validated_data['sender']
+        reply_to_id = validated_data.pop('reply_to_id', None)
+        client_message_id = validated_data.get('client_message_id')
+        
+        if client_message_id:
+            stored = stored_messages(sender, [client_message_id]).get(client_message_id)
+            if stored is not None:
+                self.replayed = True
+                return replay(stored, room.id)
+        
+        # Resolve the reply first so the row is written by a single INSERT
+        if reply_to_id:
+            validated_data['reply_to'] = Message.objects.select_related('sender').filter(
+                id=reply_to_id, room=room
+            ).first()
+        
+        try:
+            with transaction.atomic():
+                message = Message.objects.create(**validated_data)
+                RoomParticipant.increment_unread(room, sender)
+                RoomChange.objects.create(room=room, message=message, change_type='message')
+        except IntegrityError:
+            # A concurrent retry of the same send committed first
+            stored = stored_messages(sender, [client_message_id]).get(client_message_id)
+            if stored is None:
+                raise
+            self.replayed = True
+            return replay(stored, room.id)
+        
+        return message
+    
+    def to_representation(self, instance):
+        context = dict(self.context)
+        if not self.replayed:
+            # Nobody has read a message that was only just sent
+            context['read_watermarks'] = {instance.room_id: []}
+        return MessageSerializer(instance, context=context).data
+
+class BatchMessageSerializer(SendMessageSerializer):
+    room_id = serializers.UUIDField()
+
+class BatchSendSerializer(serializers.Serializer):
+    """An offline outbox flush: many messages, possibly to several rooms"""
+    messages = BatchMessageSerializer(many=True, allow_empty=False, max_length=500)
+    
+    def create(self, validated_data):
+        """Insert the batch in one transaction; callers pass rooms and sender to save()"""
+        try:
+            return self.insert(validated_data)
+        except IntegrityError:
+            # A concurrent retry stored some of these keys first; replay them
+            return self.insert(validated_data)
+    
+    def insert(self, validated_data):
+        rooms, sender = validated_data['rooms'], validated_data['sender']
+        items = validated_data['messages']
+        
+        stored = stored_messages(sender, {
+            item['client_message_id'] for item in items if item.get('client_message_id')
+        })
+        # Ids of messages returned from an earlier send rather than inserted now
+        self.replayed = {message.id for message in stored.values()}
+        
+        reply_ids = {item['reply_to_id'] for item in items if item.get('reply_to_id')}
+        replies = Message.objects.select_related('sender').filter(
+            id__in=reply_ids, room_id__in=rooms.keys()
+        ).in_bulk() if reply_ids else {}
+        
+        messages, new_messages = [], []
+        for item in items:
+            key = item.get('client_message_id')
+            if key in stored:
+                messages.append(replay(stored[key], item['room_id']))
+                continue
+            
+            item = dict(item)
+            room = rooms[item.pop('room_id')]
+            reply = replies.get(item.pop('reply_to_id', None))
+            if reply is not None and reply.room_id != room.id:
+                reply = None
+            message = Message(room=room, sender=sender, reply_to=reply, **item)
+            if key:
+                stored[key] = message  # Repeats within the batch collapse too
+            messages.append(message)
+            new_messages.append(message)
+        
+        if new_messages:
+            with transaction.atomic():
+                Message.objects.bulk_create(new_messages)
+                for room_id, count in Counter(message.room_id for message in new_messages).items():
+                    RoomParticipant.increment_unread(rooms[room_id], sender, count)
+                RoomChange.objects.bulk_create([
+                    RoomChange(room_id=message.room_id, message=message, change_type='message')
+                    for message in new_messages
+                ])
+        
+        return messages
+    
+    def to_representation(self, instance):
+        # Rooms with only fresh messages need no watermark lookup
+        replayed_rooms = {message.room_id for message in instance if message.id in self.replayed}
+        context = {**self.context, 'read_watermarks': {
+            message.room_id: [] for message in instance if message.room_id not in replayed_rooms
+        }}
+        return {
+            'messages': [
+                {'room_id': message.room_id, **message_data}
+                for message, message_data in zip(
+                    instance, MessageSerializer(instance, many=True, context=context).data
+                )
+            ]
+        }
+
+class ReceiptSerializer(serializers.Serializer):
+    message_id = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=['delivered', 'read'])
+
+class BulkReceiptSerializer(serializers.Serializer):
+    receipts = ReceiptSerializer(many=True, allow_empty=False, max_length=1000)
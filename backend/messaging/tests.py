@@ -1,3 +1,983 @@
-from django.test import TestCase
+import base64
+import json
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.db.backends.utils import CursorWrapper
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from config.ids import uuid7
+from .consumers import ChatConsumer
+from user_accounts.authentication import JWTAuthMiddleware, token_pair
+from user_accounts.models import Contact
+from .models import Room, RoomParticipant, Message, MessageStatus, RoomChange
+from .presence_fanout import PresenceFanout, build_diffs, presence_audiences
+from .routing import websocket_urlpatterns
+from .serializers import stored_messages
+from .views import SyncViewSet
 
-# Create your tests here.
+User = get_user_model()
+
+def b64(text):
+    return base64.b64encode(text.encode()).decode()
+
+def make_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pass'
+    )
+
+def make_room(*users, room_type='direct'):
+    room = Room.objects.create(room_type=room_type, created_by=users[0])
+    for user in users:
+        RoomParticipant.objects.create(room=room, user=user)
+    return room
+
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.room = make_room(self.alice, self.bob)
+        self.application = URLRouter(websocket_urlpatterns)
+
+    def communicator(self, user, room=None):
+        room = room or self.room
+        communicator = WebsocketCommunicator(self.application, f'/ws/chat/{room.id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_token_in_query_string_authenticates(self):
+        application = JWTAuthMiddleware(self.application)
+        token = token_pair(self.alice)['access']
+
+        async def run():
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{self.room.id}/?token={token}')
+            self.assertTrue((await communicator.connect())[0])
+            await communicator.disconnect()
+
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{self.room.id}/?token=forged')
+            self.assertEqual(await communicator.connect(), (False, 4401))
+
+            # A stale or missing token falls back to the session cookie
+            communicator = WebsocketCommunicator(
+                application, f'/ws/chat/{self.room.id}/?token=null', headers=[(b'cookie', cookie)]
+            )
+            self.assertTrue((await communicator.connect())[0])
+            await communicator.disconnect()
+
+        self.client.force_login(self.alice)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}".encode()
+        async_to_sync(run)()
+
+    @override_settings(RATE_LIMITS={**settings.RATE_LIMITS, 'message_send': '1/min'})
+    def test_message_frames_are_throttled(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            await alice.connect()
+            await alice.receive_json_from()  # own join
+
+            frame = {'type': 'message', 'ciphertext': 'YWJj', 'nonce': 'bjA='}
+            await alice.send_json_to(frame)
+            self.assertEqual((await alice.receive_json_from())['type'], 'message')
+            await alice.send_json_to(frame)
+            event = await alice.receive_json_from()
+            self.assertEqual(event['type'], 'error')
+            self.assertIn('rate_limit', event['errors'])
+            self.assertTrue(0 < event['retry_after'] <= 60)
+            await alice.disconnect()
+        async_to_sync(run)()
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 1)
+
+    def test_rejects_non_participant(self):
+        async def run():
+            mallory = await User.objects.acreate(username='mallory', email='m@example.com')
+            communicator = self.communicator(mallory)
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4403)
+        async_to_sync(run)()
+
+    def test_message_is_persisted_and_fanned_out(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            self.assertTrue((await alice.connect())[0])
+            self.assertTrue((await bob.connect())[0])
+
+            # Drain join notifications
+            await alice.receive_json_from()
+            await alice.receive_json_from()
+            await bob.receive_json_from()
+
+            await alice.send_json_to({
+                'type': 'message', 'ciphertext': 'YWJj', 'nonce': 'bjA=',
+            })
+            event = await bob.receive_json_from()
+            self.assertEqual(event['type'], 'message')
+            self.assertEqual(event['message']['ciphertext'], 'YWJj')
+            self.assertEqual(event['message']['sender']['username'], 'alice')
+
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(run)()
+
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 1)
+
+    def test_typing_is_relayed(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            await alice.connect()
+            await bob.connect()
+            await bob.receive_json_from()
+
+            await alice.send_json_to({'type': 'typing'})
+            event = await bob.receive_json_from()
+            self.assertEqual(event, {
+                'type': 'typing', 'user_id': str(self.alice.id), 'username': 'alice',
+            })
+
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(run)()
+
+    def test_typing_storm_is_coalesced_without_queries(self):
+        statements = []
+        execute = CursorWrapper.execute
+
+        def spy(cursor, sql, params=None):
+            statements.append(sql)
+            return execute(cursor, sql, params)
+
+        async def run():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            await alice.connect()
+            await bob.connect()
+            await bob.receive_json_from()
+
+            with mock.patch.object(CursorWrapper, 'execute', spy), \
+                    mock.patch.object(ChatConsumer, 'TYPING_MIN_INTERVAL', 0.05):
+                for _ in range(20):
+                    await alice.send_json_to({'type': 'typing'})
+                await alice.send_json_to({'type': 'stop_typing'})
+                await alice.send_json_to({'type': 'stop_typing'})
+                events = [(await bob.receive_json_from())['type'] for _ in range(2)]
+                self.assertTrue(await bob.receive_nothing())
+
+            self.assertEqual(events, ['typing', 'stop_typing'])
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(run)()
+
+        self.assertEqual(statements, [])
+
+    def test_flapping_typing_is_announced_once(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            await alice.connect()
+            await bob.connect()
+            await bob.receive_json_from()
+
+            await alice.send_json_to({'type': 'typing'})
+            await alice.send_json_to({'type': 'stop_typing'})
+            await alice.send_json_to({'type': 'typing'})
+            self.assertEqual((await bob.receive_json_from())['type'], 'typing')
+            self.assertTrue(await bob.receive_nothing(timeout=0.5))
+
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(run)()
+
+    def test_quiet_or_vanished_typist_is_stopped(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            bob = self.communicator(self.bob)
+            await alice.connect()
+            await bob.connect()
+            await bob.receive_json_from()
+
+            with mock.patch.object(ChatConsumer, 'TYPING_TIMEOUT', 0.05), \
+                    mock.patch.object(ChatConsumer, 'TYPING_MIN_INTERVAL', 0):
+                await alice.send_json_to({'type': 'typing'})
+                self.assertEqual((await bob.receive_json_from())['type'], 'typing')
+                self.assertEqual((await bob.receive_json_from())['type'], 'stop_typing')
+
+                await alice.send_json_to({'type': 'typing'})
+                await bob.receive_json_from()
+            await alice.disconnect()
+            events = [(await bob.receive_json_from())['type'] for _ in range(2)]
+            self.assertEqual(events, ['stop_typing', 'user_left'])
+            await bob.disconnect()
+        async_to_sync(run)()
+
+    def test_socket_drives_presence_and_last_seen(self):
+        cache.clear()
+        seen = self.alice.last_seen
+
+        async def run():
+            phone = self.communicator(self.alice)
+            laptop = self.communicator(self.alice)
+            await phone.connect()
+            await laptop.connect()
+            await phone.send_json_to({'type': 'heartbeat'})
+            self.assertTrue(self.alice.is_online)
+
+            await phone.disconnect()
+            self.assertTrue(self.alice.is_online)
+            await laptop.disconnect()
+        async_to_sync(run)()
+
+        self.assertFalse(self.alice.is_online)
+        self.alice.refresh_from_db()
+        self.assertGreater(self.alice.last_seen, seen)
+
+    def test_malformed_frames_get_an_error_and_keep_the_socket(self):
+        async def run():
+            alice = self.communicator(self.alice)
+            await alice.connect()
+            await alice.receive_json_from()  # own join
+            for frame in ('{not json', '[1, 2]', '7', 'null'):
+                await alice.send_to(text_data=frame)
+                self.assertEqual((await alice.receive_json_from())['errors'], {'frame': ['Malformed frame.']})
+            await alice.send_to(text_data='{"type": "typing"}')
+            self.assertEqual((await alice.receive_json_from())['type'], 'typing')
+            await alice.disconnect()
+        async_to_sync(run)()
+
+    def test_heartbeat_after_a_lapse_flips_back_online(self):
+        cache.clear()
+
+        async def run():
+            phone = self.communicator(self.alice)
+            await phone.connect()
+            await phone.receive_json_from()  # own join
+            await sync_to_async(cache.clear)()  # the slot lapsed while the device slept
+            with mock.patch('messaging.consumers.fanout.record') as record:
+                await phone.send_json_to({'type': 'heartbeat'})
+                await phone.receive_nothing()
+            record.assert_called_once_with(self.alice.id, is_online=True)
+            await phone.disconnect()
+        async_to_sync(run)()
+
+    def test_presence_flips_reach_room_peers_in_one_diff(self):
+        cache.clear()
+
+        async def run():
+            bob = WebsocketCommunicator(self.application, '/ws/presence/')
+            bob.scope['user'] = self.bob
+            bob_room = self.communicator(self.bob)
+            with mock.patch('messaging.presence_fanout.FLUSH_INTERVAL', 0.05):
+                await bob.connect()
+                await bob_room.connect()
+                await bob_room.receive_json_from()  # own join
+                alice = self.communicator(self.alice)
+                await alice.connect()
+                await alice.disconnect()
+                frame = await bob.receive_json_from(timeout=2)
+            # Room sockets carry room events only, so the diff is not repeated
+            events = [(await bob_room.receive_json_from())['type'] for _ in range(2)]
+            self.assertEqual(events, ['user_joined', 'user_left'])
+            self.assertTrue(await bob_room.receive_nothing(timeout=0.2))
+            await bob_room.disconnect()
+            await bob.disconnect()
+            return frame
+        frame = async_to_sync(run)()
+
+        # Online then offline within one interval collapses to the latest state
+        self.assertEqual(frame['type'], 'presence')
+        self.assertEqual(len(frame['changes']), 1)
+        self.assertEqual(frame['changes'][0]['user_id'], str(self.alice.id))
+        self.assertFalse(frame['changes'][0]['is_online'])
+
+    def test_failed_presence_flush_keeps_the_batch(self):
+        batcher = PresenceFanout()
+        batcher.pending = {self.alice.id: {'user_id': self.alice.id, 'is_online': True, 'last_seen': None}}
+        with mock.patch('messaging.presence_fanout.build_diffs', side_effect=DatabaseError), \
+                self.assertLogs('messaging.presence_fanout', 'ERROR'):
+            async_to_sync(batcher.flush)()
+        self.assertEqual(list(batcher.pending), [self.alice.id])
+
+class MessagePaginationTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.room = make_room(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+        # Pairs of messages share a timestamp to exercise the id tiebreaker
+        base = timezone.now()
+        for i in range(10):
+            message = Message.objects.create(
+                room=self.room, sender=self.alice, ciphertext=str(i).encode(), nonce=b'n'
+            )
+            Message.objects.filter(id=message.id).update(
+                created_at=base + timedelta(seconds=i // 2)
+            )
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_walks_history_without_gaps_or_duplicates(self):
+        page = self.fetch(f'/api/chat/messages/?room={self.room.id}&limit=3')
+        self.assertIsNone(page['previous'])
+        seen = [m['id'] for m in page['results']]
+        while page['next']:
+            page = self.fetch(page['next'])
+            seen += [m['id'] for m in page['results']]
+
+        expected = Message.objects.filter(room=self.room).order_by('-created_at', '-id')
+        self.assertEqual(seen, [str(m.id) for m in expected])
+
+    def test_after_cursor_returns_newer_messages(self):
+        first = self.fetch(f'/api/chat/messages/?room={self.room.id}&limit=4')
+        second = self.fetch(first['next'])
+        newer = self.fetch(second['previous'])
+        self.assertEqual(newer['results'], first['results'])
+        self.assertIsNone(newer['previous'])
+
+    def test_page_cost_is_constant(self):
+        first = self.fetch(f'/api/chat/messages/?room={self.room.id}&limit=2')
+        with CaptureQueriesContext(connection) as shallow:
+            page = self.fetch(first['next'])
+        while page['next']:
+            with CaptureQueriesContext(connection) as deep:
+                page = self.fetch(page['next'])
+
+        # Room check, the page itself and the room's read watermarks
+        self.assertEqual(len(shallow), 3)
+        self.assertEqual(len(deep), 3)
+        sql = ' '.join(q['sql'] for q in deep.captured_queries).upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_rejects_malformed_cursor(self):
+        response = self.client.get(f'/api/chat/messages/?room={self.room.id}&before=nope')
+        self.assertEqual(response.status_code, 404)
+
+class RoomInboxTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.peers = 0
+
+    def add_rooms(self, count):
+        for _ in range(count):
+            self.peers += 1
+            peer = make_user(f'peer{self.peers}')
+            room = make_room(self.alice, peer)
+            first = Message.objects.create(room=room, sender=peer, ciphertext=b'a', nonce=b'n')
+            Message.objects.create(
+                room=room, sender=peer, ciphertext=b'b', nonce=b'n', reply_to=first
+            )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/chat/rooms/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.data
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        self.add_rooms(2)
+        few, _ = self.count_list_queries()
+        self.add_rooms(8)
+        many, data = self.count_list_queries()
+        self.assertEqual(len(data), 10)
+        self.assertEqual(few, many)
+
+    def test_inbox_fields_match_model_helpers(self):
+        self.add_rooms(2)
+        room = Room.objects.filter(participants=self.alice).first()
+        RoomParticipant.objects.filter(room=room, user=self.alice).update(
+            last_read_at=timezone.now()
+        )
+        Message.objects.create(
+            room=room, sender=room.participants.exclude(id=self.alice.id).get(),
+            ciphertext=b'c', nonce=b'n'
+        )
+
+        _, data = self.count_list_queries()
+        for item in data:
+            room = Room.objects.get(id=item['id'])
+            self.assertEqual(item['unread_count'], room.get_unread_count(self.alice))
+            self.assertEqual(item['participant_count'], 2)
+            self.assertEqual(item['last_message']['id'], str(room.get_last_message().id))
+
+    def test_sorted_by_latest_message_without_touching_rooms(self):
+        self.add_rooms(3)
+        oldest = Room.objects.filter(participants=self.alice).order_by('created_at').first()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/chat/messages/', {
+                'room_id': str(oldest.id), 'ciphertext': b64('hi'), 'nonce': 'bg==',
+            })
+        self.assertEqual(response.status_code, 201)
+        room_writes = [q['sql'] for q in ctx if q['sql'].startswith('UPDATE "chat_rooms"')]
+        self.assertEqual(room_writes, [])
+
+        _, data = self.count_list_queries()
+        self.assertEqual(data[0]['id'], str(oldest.id))
+        self.assertEqual(data[0]['last_activity_at'], data[0]['last_message']['created_at'])
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.carol = make_user('carol')
+        self.room = make_room(self.alice, self.bob, self.carol, room_type='group')
+        self.client = APIClient()
+
+    def send(self, user, text='x'):
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/chat/messages/', {
+            'room_id': str(self.room.id), 'ciphertext': b64(text), 'nonce': 'bg==',
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def counter(self, user):
+        return RoomParticipant.objects.get(room=self.room, user=user).unread_count
+
+    def test_send_increments_other_participants(self):
+        self.send(self.alice)
+        self.send(self.alice)
+        self.send(self.bob)
+        self.assertEqual(self.counter(self.alice), 1)
+        self.assertEqual(self.counter(self.bob), 2)
+        self.assertEqual(self.counter(self.carol), 3)
+
+    def test_mark_as_read_resets_and_badge_totals(self):
+        self.send(self.alice)
+        self.send(self.alice)
+        other = make_room(self.alice, self.carol)
+        Message.objects.create(room=other, sender=self.alice, ciphertext=b'y', nonce=b'n')
+        RoomParticipant.increment_unread(other, self.alice)
+
+        self.client.force_authenticate(self.carol)
+        response = self.client.get('/api/chat/rooms/unread_total/')
+        self.assertEqual(response.data, {'total': 3, 'rooms': 2})
+
+        self.client.post(f'/api/chat/rooms/{self.room.id}/mark_as_read/')
+        self.assertEqual(self.counter(self.carol), 0)
+        response = self.client.get('/api/chat/rooms/unread_total/')
+        self.assertEqual(response.data, {'total': 1, 'rooms': 1})
+
+    def test_rebuild_command_matches_slow_path(self):
+        self.send(self.alice)
+        self.send(self.bob)
+        RoomParticipant.objects.update(unread_count=42)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_unread_counts', '--check', stdout=StringIO(), stderr=StringIO())
+
+        call_command('rebuild_unread_counts', stdout=StringIO())
+        for participant in RoomParticipant.objects.all():
+            self.assertEqual(participant.unread_count, participant.count_unread_messages())
+
+class SendMessageTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.room = make_room(self.alice, self.bob)
+        self.other = make_room(self.alice, make_user('carol'))
+        self.original = Message.objects.create(
+            room=self.room, sender=self.bob, ciphertext=b'q', nonce=b'n'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def message_writes(self, ctx):
+        return [
+            q['sql'] for q in ctx
+            if q['sql'].startswith(('INSERT INTO "messages"', 'UPDATE "messages"'))
+        ]
+
+    @override_settings(RATE_LIMITS={**settings.RATE_LIMITS, 'message_send': '1/min'})
+    def test_sends_are_throttled_per_user(self):
+        payload = {'room_id': str(self.room.id), 'ciphertext': b64('hi'), 'nonce': 'bg=='}
+        self.assertEqual(self.client.post('/api/chat/messages/', payload).status_code, 201)
+        response = self.client.post('/api/chat/messages/', payload)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.post('/api/chat/messages/', payload).status_code, 201)
+
+    def test_reply_is_written_by_a_single_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/chat/messages/', {
+                'room_id': str(self.room.id), 'ciphertext': b64('re'), 'nonce': 'bg==',
+                'reply_to_id': str(self.original.id),
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.message_writes(ctx)), 1)
+        statements = [q['sql'] for q in ctx if 'SAVEPOINT' not in q['sql']]
+        # Room check, reply lookup, insert, unread counters and the change log
+        self.assertEqual(len(statements), 5)
+        self.assertEqual(response.data['reply_to']['id'], str(self.original.id))
+        self.assertEqual(response.data['read_by'], [])
+
+    def test_batch_inserts_across_rooms(self):
+        payload = {'messages': [
+            {'room_id': str(self.room.id), 'ciphertext': b64('1'), 'nonce': 'bg==',
+             'reply_to_id': str(self.original.id)},
+            {'room_id': str(self.other.id), 'ciphertext': b64('2'), 'nonce': 'bg=='},
+            {'room_id': str(self.room.id), 'ciphertext': b64('3'), 'nonce': 'bg=='},
+        ]}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/chat/messages/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.message_writes(ctx)), 1)
+
+        sent = response.data['messages']
+        self.assertEqual(
+            [item['room_id'] for item in sent], [self.room.id, self.other.id, self.room.id]
+        )
+        self.assertEqual(sent[0]['reply_to']['id'], str(self.original.id))
+        self.assertEqual(RoomParticipant.objects.get(room=self.room, user=self.bob).unread_count, 2)
+        self.assertEqual(RoomChange.objects.filter(change_type='message').count(), 3)
+
+    def test_retry_with_same_key_replays_stored_message(self):
+        payload = {
+            'room_id': str(self.room.id), 'ciphertext': b64('once'), 'nonce': 'bg==',
+            'client_message_id': 'k-1',
+        }
+        first = self.client.post('/api/chat/messages/', payload)
+        with mock.patch('messaging.views.broadcast_to_room') as broadcast:
+            retry = self.client.post('/api/chat/messages/', payload)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        broadcast.assert_not_called()
+        self.assertEqual(Message.objects.filter(client_message_id='k-1').count(), 1)
+        self.assertEqual(RoomParticipant.objects.get(room=self.room, user=self.bob).unread_count, 1)
+
+        # Keys are scoped to the sender
+        self.client.force_authenticate(self.bob)
+        other = self.client.post('/api/chat/messages/', payload)
+        self.assertEqual(other.status_code, 201)
+        self.assertNotEqual(other.data['id'], first.data['id'])
+
+    def test_key_reused_for_another_room_is_a_conflict(self):
+        payload = {'ciphertext': b64('once'), 'nonce': 'bg==', 'client_message_id': 'k-1'}
+        first = self.client.post('/api/chat/messages/', {**payload, 'room_id': str(self.room.id)})
+        self.assertEqual(first.status_code, 201)
+        elsewhere = self.client.post('/api/chat/messages/', {**payload, 'room_id': str(self.other.id)})
+        self.assertEqual(elsewhere.status_code, 409)
+        response = self.client.post('/api/chat/messages/batch/', {'messages': [
+            {**payload, 'room_id': str(self.other.id)},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Message.objects.filter(client_message_id='k-1').count(), 1)
+
+    def test_losing_the_insert_race_replays_the_winner(self):
+        winner = Message.objects.create(
+            room=self.room, sender=self.alice, ciphertext=b'w', nonce=b'n', client_message_id='k-1'
+        )
+        stored = stored_messages(self.alice, ['k-1'])
+        with mock.patch('messaging.serializers.stored_messages', side_effect=[{}, stored]):
+            response = self.client.post('/api/chat/messages/', {
+                'room_id': str(self.room.id), 'ciphertext': b64('w'), 'nonce': 'bg==',
+                'client_message_id': 'k-1',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], str(winner.id))
+
+    def test_batch_replays_known_keys(self):
+        sent = self.client.post('/api/chat/messages/', {
+            'room_id': str(self.room.id), 'ciphertext': b64('1'), 'nonce': 'bg==',
+            'client_message_id': 'k-1',
+        })
+        outbox = {'messages': [
+            {'room_id': str(self.room.id), 'ciphertext': b64('1'), 'nonce': 'bg==',
+             'client_message_id': 'k-1'},
+            {'room_id': str(self.room.id), 'ciphertext': b64('2'), 'nonce': 'bg==',
+             'client_message_id': 'k-2'},
+            {'room_id': str(self.room.id), 'ciphertext': b64('2'), 'nonce': 'bg==',
+             'client_message_id': 'k-2'},
+        ]}
+        with mock.patch('messaging.views.broadcast_to_room') as broadcast:
+            response = self.client.post('/api/chat/messages/batch/', outbox, format='json')
+        ids = [item['id'] for item in response.data['messages']]
+        self.assertEqual(ids[0], sent.data['id'])
+        self.assertEqual(ids[1], ids[2])
+        self.assertEqual(broadcast.call_count, 1)
+        self.assertEqual(Message.objects.filter(sender=self.alice).count(), 2)
+
+    def test_batch_is_rejected_if_any_room_is_foreign(self):
+        foreign = make_room(self.bob, make_user('dave'))
+        response = self.client.post('/api/chat/messages/batch/', {'messages': [
+            {'room_id': str(self.room.id), 'ciphertext': b64('1'), 'nonce': 'bg=='},
+            {'room_id': str(foreign.id), 'ciphertext': b64('2'), 'nonce': 'bg=='},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Message.objects.count(), 1)
+
+class ReadReceiptTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.carol = make_user('carol')
+        self.room = make_room(self.alice, self.bob, self.carol, room_type='group')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+        base = timezone.now() - timedelta(minutes=10)
+        self.messages = []
+        for i in range(4):
+            message = Message.objects.create(
+                room=self.room, sender=self.alice, ciphertext=str(i).encode(), nonce=b'n'
+            )
+            Message.objects.filter(id=message.id).update(
+                created_at=base + timedelta(minutes=i)
+            )
+            self.messages.append(message)
+
+        # Bob has read the first two messages, Carol everything
+        RoomParticipant.objects.filter(room=self.room, user=self.bob).update(
+            last_read_at=base + timedelta(minutes=1)
+        )
+        RoomParticipant.objects.filter(room=self.room, user=self.carol).update(
+            last_read_at=timezone.now()
+        )
+
+    def test_read_by_is_derived_from_watermarks(self):
+        response = self.client.get(f'/api/chat/messages/?room={self.room.id}')
+        read_by = {m['ciphertext']: sorted(m['read_by']) for m in response.data['results']}
+        self.assertEqual(read_by, {
+            b'0': ['bob', 'carol'],
+            b'1': ['bob', 'carol'],
+            b'2': ['carol'],
+            b'3': ['carol'],
+        })
+
+    def test_sender_is_never_listed(self):
+        RoomParticipant.objects.filter(room=self.room, user=self.alice).update(
+            last_read_at=timezone.now()
+        )
+        response = self.client.get(f'/api/chat/messages/?room={self.room.id}')
+        for message in response.data['results']:
+            self.assertNotIn('alice', message['read_by'])
+
+class BulkReceiptTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.room = make_room(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.alice, ciphertext=str(i).encode(), nonce=b'n')
+            for i in range(5)
+        ]
+        RoomParticipant.objects.filter(room=self.room, user=self.bob).update(unread_count=5)
+
+    def post(self, receipts):
+        return self.client.post('/api/chat/receipts/', {'receipts': [
+            {'message_id': str(message.id), 'status': receipt_status}
+            for message, receipt_status in receipts
+        ]}, format='json')
+
+    def test_batch_is_upserted_in_fixed_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post([(self.messages[0], 'delivered')])
+        with CaptureQueriesContext(connection) as large:
+            response = self.post([(m, 'delivered') for m in self.messages])
+
+        self.assertEqual(response.data, {'accepted': 4, 'ignored': 1})
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(
+            MessageStatus.objects.filter(user=self.bob, status='delivered').count(), 5
+        )
+
+    def test_downgrades_are_ignored(self):
+        self.post([(self.messages[1], 'read')])
+        response = self.post([(self.messages[1], 'delivered'), (self.messages[2], 'delivered')])
+        self.assertEqual(response.data, {'accepted': 1, 'ignored': 1})
+        self.assertEqual(
+            MessageStatus.objects.get(message=self.messages[1], user=self.bob).status, 'read'
+        )
+
+    def test_concurrent_read_is_not_downgraded(self):
+        bulk_create = MessageStatus.objects.bulk_create
+
+        def read_lands_first(objs, **kwargs):
+            # Another request stores 'read' after this one checked the status
+            MessageStatus.objects.create(message=self.messages[0], user=self.bob, status='read')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(MessageStatus.objects, 'bulk_create', side_effect=read_lands_first):
+            self.post([(self.messages[0], 'delivered')])
+        self.assertEqual(
+            MessageStatus.objects.get(message=self.messages[0], user=self.bob).status, 'read'
+        )
+
+        self.post([(self.messages[1], 'delivered')])
+        self.post([(self.messages[1], 'read')])
+        self.assertEqual(
+            MessageStatus.objects.get(message=self.messages[1], user=self.bob).status, 'read'
+        )
+
+    def test_read_receipts_advance_watermark(self):
+        self.post([(self.messages[2], 'read')])
+        participant = RoomParticipant.objects.get(room=self.room, user=self.bob)
+        self.assertEqual(participant.last_read_at, Message.objects.get(id=self.messages[2].id).created_at)
+        self.assertEqual(participant.unread_count, participant.count_unread_messages())
+
+    def test_rejects_messages_outside_callers_rooms(self):
+        carol = make_user('carol')
+        self.client.force_authenticate(carol)
+        response = self.post([(self.messages[0], 'read')])
+        self.assertEqual(response.data, {'accepted': 0, 'ignored': 1})
+        self.assertFalse(MessageStatus.objects.exists())
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.room = Room.objects.create(room_type='direct', created_by=self.alice)
+        self.room.add_participants([self.alice, self.bob])
+        lag = mock.patch.object(SyncViewSet, 'commit_lag', timedelta(0))
+        lag.start()
+        self.addCleanup(lag.stop)
+
+    def sync(self, cursor=None):
+        url = '/api/chat/sync/' if cursor is None else f'/api/chat/sync/?since={cursor}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def send(self, user, text):
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/chat/messages/', {
+            'room_id': str(self.room.id), 'ciphertext': b64(text), 'nonce': 'bg==',
+        })
+        self.client.force_authenticate(self.alice)
+        return response.data['id']
+
+    def test_replays_changes_since_cursor(self):
+        cursor = self.sync()['cursor']
+        kept = self.send(self.bob, 'hello')
+        deleted = self.send(self.alice, 'oops')
+        self.client.delete(f'/api/chat/messages/{deleted}/?room={self.room.id}')
+        self.client.force_authenticate(self.bob)
+        self.client.post(f'/api/chat/rooms/{self.room.id}/mark_as_read/')
+        self.client.force_authenticate(self.alice)
+
+        data = self.sync(cursor)
+        messages = {m['id']: m for m in data['messages']}
+        self.assertEqual(set(messages), {kept, deleted})
+        self.assertIsNotNone(messages[deleted]['deleted_at'])
+        self.assertEqual(messages[kept]['room_id'], self.room.id)
+        self.assertEqual([w['user_id'] for w in data['read_watermarks']], [self.bob.id])
+
+        # Nothing new after the returned cursor
+        later = self.sync(data['cursor'])
+        self.assertEqual(later['messages'], [])
+        self.assertEqual(later['cursor'], data['cursor'])
+
+    def test_cursor_stays_behind_changes_that_may_not_be_committed(self):
+        RoomChange.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        cursor = self.sync()['cursor']
+        first = self.send(self.bob, 'hello')
+        with mock.patch.object(SyncViewSet, 'commit_lag', timedelta(minutes=1)):
+            self.assertEqual(self.sync()['cursor'], cursor)
+            data = self.sync(cursor)
+            self.assertEqual((data['messages'], data['cursor']), ([], cursor))
+        self.assertEqual([m['id'] for m in self.sync(cursor)['messages']], [first])
+
+    def test_membership_changes_and_room_scoping(self):
+        data = self.sync(0)
+        self.assertEqual(
+            {m['user_id'] for m in data['memberships']}, {self.alice.id, self.bob.id}
+        )
+
+        carol = make_user('carol')
+        other = make_room(self.bob, carol)
+        Message.objects.create(room=other, sender=carol, ciphertext=b'x', nonce=b'n')
+        RoomChange.objects.create(room=other, change_type='member_joined', user=carol)
+        self.assertEqual(self.sync(data['cursor'])['memberships'], [])
+
+class PresenceAudienceTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.friend = make_user('friend')  # Has alice as a contact
+        self.peer = make_user('peer')      # Shares a group with alice
+        self.stranger = make_user('stranger')
+        Contact.objects.create(user=self.friend, contact=self.alice)
+        make_room(self.alice, self.peer, room_type='group')
+
+    def audience(self):
+        return presence_audiences([self.alice.id]).get(self.alice.id, set())
+
+    def test_contacts_and_room_peers_only(self):
+        self.assertEqual(self.audience(), {self.friend.id, self.peer.id})
+
+    def test_show_last_seen_is_applied_to_the_audience(self):
+        Contact.objects.create(user=self.alice, contact=self.peer)
+        User.objects.filter(id=self.alice.id).update(show_last_seen='contacts')
+        self.assertEqual(self.audience(), {self.peer.id})
+        User.objects.filter(id=self.alice.id).update(show_last_seen='nobody')
+        self.assertEqual(self.audience(), set())
+
+    def test_blocked_watchers_are_dropped(self):
+        Contact.objects.create(user=self.alice, contact=self.peer, blocked=True)
+        self.assertEqual(self.audience(), {self.friend.id})
+
+    def test_diffs_are_built_in_fixed_queries(self):
+        others = [make_user(f'user{i}') for i in range(5)]
+        for other in others:
+            Contact.objects.create(user=self.friend, contact=other)
+        changes = {
+            user.id: {'user_id': user.id, 'is_online': True, 'last_seen': None}
+            for user in [self.alice, *others]
+        }
+        with self.assertNumQueries(4):
+            diffs = build_diffs(changes)
+        self.assertEqual(len(diffs[self.friend.id]), 6)
+        self.assertEqual(len(diffs[self.peer.id]), 1)
+
+class DirectRoomTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+
+    def test_endpoint_reuses_room_for_either_user(self):
+        self.client.force_authenticate(self.alice)
+        first = self.client.post('/api/chat/rooms/get_or_create_direct/', {'user_id': self.bob.id})
+        self.assertEqual(first.status_code, 201)
+
+        self.client.force_authenticate(self.bob)
+        second = self.client.post('/api/chat/rooms/get_or_create_direct/', {'user_id': self.alice.id})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(second.data['participant_count'], 2)
+
+    def test_existing_room_is_a_single_probe(self):
+        room, created = Room.get_or_create_direct(self.alice, self.bob)
+        self.assertTrue(created)
+        with self.assertNumQueries(1):
+            found, created = Room.get_or_create_direct(self.bob, self.alice)
+        self.assertEqual((found, created), (room, False))
+
+    def test_losing_the_insert_race_returns_the_winner(self):
+        winner = Room.objects.create(
+            room_type='direct', direct_key=Room.make_direct_key(self.alice, self.bob)
+        )
+        original_filter = Room.objects.filter
+
+        # Simulate a concurrent creator committing between lookup and insert
+        def stale_filter(*args, **kwargs):
+            if 'direct_key' in kwargs:
+                return Room.objects.none()
+            return original_filter(*args, **kwargs)
+
+        with mock.patch.object(Room.objects, 'filter', side_effect=stale_filter):
+            room, created = Room.get_or_create_direct(self.alice, self.bob)
+        self.assertEqual((room, created), (winner, False))
+        self.assertEqual(Room.objects.count(), 1)
+
+class TimeOrderedIdTests(SimpleTestCase):
+    def test_ids_are_version_7_and_monotonic(self):
+        ids = [uuid7() for _ in range(10_000)]
+        self.assertTrue(all(value.version == 7 for value in ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual([value.hex for value in ids], sorted(value.hex for value in ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_models_default_to_time_ordered_ids(self):
+        self.assertIs(Message._meta.pk.default, uuid7)
+        self.assertIs(Room._meta.pk.default, uuid7)
+
+class BinaryWireTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.room = make_room(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.ciphertext = bytes(range(256))
+
+    def test_json_clients_keep_base64(self):
+        response = self.client.post('/api/chat/messages/', {
+            'room_id': str(self.room.id),
+            'ciphertext': base64.b64encode(self.ciphertext).decode(),
+            'nonce': base64.b64encode(b'\x00' * 12).decode(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(bytes(Message.objects.get().ciphertext), self.ciphertext)
+        body = json.loads(response.content)
+        self.assertEqual(base64.b64decode(body['ciphertext']), self.ciphertext)
+
+    def test_msgpack_round_trip_skips_base64(self):
+        payload = msgpack.packb({
+            'room_id': str(self.room.id), 'ciphertext': self.ciphertext, 'nonce': b'\x01' * 12,
+        })
+        response = self.client.post(
+            '/api/chat/messages/', payload,
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['ciphertext'], self.ciphertext)
+
+        response = self.client.get(
+            f'/api/chat/messages/?room={self.room.id}', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(msgpack.unpackb(response.content)['results'][0]['nonce'], b'\x01' * 12)
+
+    def test_rejects_invalid_base64(self):
+        response = self.client.post('/api/chat/messages/', {
+            'room_id': str(self.room.id), 'ciphertext': 'not base64!', 'nonce': 'bg==',
+        })
+        self.assertEqual(response.status_code, 400)
+
+class BinarySocketTests(TransactionTestCase):
+    def test_binary_frames_fan_out_to_json_and_binary_clients(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        room = make_room(alice, bob)
+        application = URLRouter(websocket_urlpatterns)
+
+        async def run():
+            sockets = []
+            for user in (alice, bob):
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{room.id}/')
+                communicator.scope['user'] = user
+                await communicator.connect()
+                sockets.append(communicator)
+            binary, text = sockets
+            await text.receive_json_from()  # bob joined
+
+            await binary.send_to(bytes_data=msgpack.packb({
+                'type': 'message', 'ciphertext': b'\xff\x00', 'nonce': b'\x02' * 12,
+            }))
+            event = await text.receive_json_from()
+            self.assertEqual(event['message']['ciphertext'], base64.b64encode(b'\xff\x00').decode())
+
+            # Join events arrived as text before the client switched to binary
+            while True:
+                frame = await binary.receive_from()
+                if isinstance(frame, bytes):
+                    frame = msgpack.unpackb(frame)
+                    break
+            self.assertEqual(frame['message']['ciphertext'], b'\xff\x00')
+
+            for communicator in sockets:
+                await communicator.disconnect()
+        async_to_sync(run)()
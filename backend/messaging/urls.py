@@ -1,10 +1,12 @@
 ﻿from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from .views import RoomViewSet, MessageViewSet
+from .views import RoomViewSet, MessageViewSet, ReceiptViewSet, SyncViewSet
 
 router = DefaultRouter()
 router.register('rooms', RoomViewSet, basename='room')
 router.register('messages', MessageViewSet, basename='message')
+router.register('receipts', ReceiptViewSet, basename='receipt')
+router.register('sync', SyncViewSet, basename='sync')
 
 urlpatterns = [
     path('', include(router.urls)),
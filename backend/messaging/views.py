@@ -1,31 +1,86 @@
+from datetime import timedelta
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Prefetch
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
-from .models import Room, Message, RoomParticipant
+from django.utils import timezone
+from config.ratelimit import MessageSendThrottle
+from user_accounts.serializers import prime_presence
+from .consumers import broadcast_to_room
+from .models import Room, Message, RoomParticipant, MessageStatus, RoomChange, subquery_count
+from .pagination import MessageCursorPagination
+from .parsers import MessagePackParser
+from .renderers import MessagePackRenderer
 from .serializers import (
     RoomSerializer, MessageSerializer, CreateDirectRoomSerializer,
-    SendMessageSerializer
+    SendMessageSerializer, BatchSendSerializer, BulkReceiptSerializer
 )
 
 User = get_user_model()
 
+def attach_last_messages(rooms):
+    """Load every room's last message in one query (plus fixed prefetches)"""
+    message_ids = [room.last_message_id for room in rooms if room.last_message_id]
+    messages = Message.objects.filter(id__in=message_ids).select_related(
+        'sender', 'reply_to__sender'
+    ).in_bulk()
+    for room in rooms:
+        room.last_message = messages.get(room.last_message_id)
+    return rooms
+
 class RoomViewSet(viewsets.ModelViewSet):
     serializer_class = RoomSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
+        user = self.request.user
+        latest_message = Message.objects.filter(room=OuterRef('pk')).order_by('-created_at')
+        
         return Room.objects.filter(
-            participants=self.request.user,
+            roomparticipant__user=user,
             is_active=True
+        ).annotate(
+            annotated_unread_count=F('roomparticipant__unread_count'),
+            annotated_participant_count=subquery_count(
+                RoomParticipant.objects.filter(room=OuterRef('pk'))
+            ),
+            last_message_id=Subquery(latest_message.values('id')[:1]),
+            # Activity comes from the (room, -created_at) index rather than
+            # a Room row rewritten on every send
+            last_activity_at=Coalesce(
+                Subquery(latest_message.values('created_at')[:1]),
+                'created_at'
+            ),
         ).prefetch_related(
             Prefetch(
                 'roomparticipant_set',
                 queryset=RoomParticipant.objects.select_related('user')
             )
-        ).order_by('-updated_at')
+        ).order_by('-last_activity_at')
+    
+    def get_presence_context(self, rooms):
+        """Serializer context with presence for everyone the rooms show"""
+        user_ids = {
+            participant.user_id
+            for room in rooms for participant in room.roomparticipant_set.all()
+        }
+        user_ids.update(room.last_message.sender_id for room in rooms if room.last_message)
+        return prime_presence(self.get_serializer_context(), user_ids)
+    
+    def list(self, request, *args, **kwargs):
+        rooms = attach_last_messages(list(self.filter_queryset(self.get_queryset())))
+        serializer = self.get_serializer(rooms, many=True, context=self.get_presence_context(rooms))
+        return Response(serializer.data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        room = attach_last_messages([self.get_object()])[0]
+        return Response(self.get_serializer(room, context=self.get_presence_context([room])).data)
     
     @action(detail=False, methods=['post'])
     def get_or_create_direct(self, request):
@@ -37,31 +92,11 @@ class RoomViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         
         other_user = User.objects.get(id=serializer.validated_data['user_id'])
-        
-        # Check if room already exists
-        existing_room = Room.objects.filter(
-            room_type='direct',
-            participants=request.user
-        ).filter(
-            participants=other_user
-        ).first()
-        
-        if existing_room:
-            return Response(RoomSerializer(existing_room, context={'request': request}).data)
-        
-        # Create new room
-        room = Room.objects.create(
-            room_type='direct',
-            created_by=request.user
-        )
-        
-        # Add participants
-        RoomParticipant.objects.create(room=room, user=request.user, role='member')
-        RoomParticipant.objects.create(room=room, user=other_user, role='member')
+        room, created = Room.get_or_create_direct(request.user, other_user)
         
         return Response(
             RoomSerializer(room, context={'request': request}).data,
-            status=status.HTTP_201_CREATED
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
     
     @action(detail=True, methods=['post'])
@@ -80,10 +115,34 @@ class RoomViewSet(viewsets.ModelViewSet):
             {'error': 'Not a participant of this room'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    
+    @action(detail=False, methods=['get'])
+    def unread_total(self, request):
+        """Total unread messages across all of the user's rooms (badge count)"""
+        totals = RoomParticipant.objects.filter(
+            user=request.user,
+            room__is_active=True,
+            unread_count__gt=0
+        ).aggregate(
+            total=Sum('unread_count'),
+            rooms=Count('id')
+        )
+        return Response({
+            'total': totals['total'] or 0,
+            'rooms': totals['rooms']
+        })
 
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [MessagePackParser]
+    
+    def get_throttles(self):
+        if self.action in ('create', 'batch'):
+            return [MessageSendThrottle()]
+        return super().get_throttles()
     
     def get_queryset(self):
         room_id = self.request.query_params.get('room')
@@ -96,7 +155,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         return Message.objects.filter(
             room=room,
             deleted_at__isnull=True
-        ).select_related('sender').order_by('-created_at')
+        ).select_related('sender', 'reply_to__sender').order_by('-created_at')
     
     def create(self, request, *args, **kwargs):
         """Send a new message"""
@@ -105,31 +164,222 @@ class MessageViewSet(viewsets.ModelViewSet):
         
         serializer = SendMessageSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        serializer.save(room=room, sender=request.user)
         
-        # Create message
-        message_data = serializer.validated_data.copy()
-        message_data.pop('reply_to_id', None)
+        data = serializer.data
+        if serializer.replayed:
+            # A retried send: the original was already fanned out
+            return Response(data, status=status.HTTP_200_OK)
+        broadcast_to_room(room.id, {'type': 'chat.message', 'message': data})
         
-        message = Message.objects.create(
-            room=room,
-            sender=request.user,
-            **message_data
-        )
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Send many messages, e.g. an offline outbox, in one transaction"""
+        serializer = BatchSendSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Handle reply
-        reply_to_id = serializer.validated_data.get('reply_to_id')
-        if reply_to_id:
-            try:
-                reply_message = Message.objects.get(id=reply_to_id, room=room)
-                message.reply_to = reply_message
-                message.save()
-            except Message.DoesNotExist:
-                pass
+        room_ids = {item['room_id'] for item in serializer.validated_data['messages']}
+        rooms = Room.objects.filter(id__in=room_ids, participants=request.user).in_bulk()
+        if len(rooms) != len(room_ids):
+            raise NotFound('One or more rooms were not found.')
         
-        # Update room's updated_at timestamp
-        room.save(update_fields=['updated_at'])
+        serializer.save(rooms=rooms, sender=request.user)
         
-        return Response(
-            MessageSerializer(message).data,
-            status=status.HTTP_201_CREATED
+        data = serializer.data
+        # Retried sends were fanned out the first time round
+        fanned_out = set(serializer.replayed)
+        for message, message_data in zip(serializer.instance, data['messages']):
+            if message.id not in fanned_out:
+                fanned_out.add(message.id)
+                broadcast_to_room(message.room_id, {'type': 'chat.message', 'message': message_data})
+        
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    def perform_update(self, serializer):
+        message = serializer.save(edited_at=timezone.now())
+        RoomChange.objects.create(room_id=message.room_id, message=message, change_type='message_edited')
+    
+    def perform_destroy(self, instance):
+        # Soft delete so reconnecting clients can sync the removal
+        instance.deleted_at = timezone.now()
+        instance.save(update_fields=['deleted_at'])
+        RoomChange.objects.create(room_id=instance.room_id, message=instance, change_type='message_deleted')
+
+class ReceiptViewSet(viewsets.ViewSet):
+    """Bulk delivery/read receipt ingestion"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def create(self, request):
+        serializer = BulkReceiptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rank = MessageStatus.STATUS_RANK
+        
+        # Collapse duplicates in the batch to the highest requested status
+        requested = {}
+        for receipt in serializer.validated_data['receipts']:
+            message_id, new_status = receipt['message_id'], receipt['status']
+            if rank[new_status] > rank.get(requested.get(message_id), -1):
+                requested[message_id] = new_status
+        
+        # One query validates membership and fetches the current status
+        messages = Message.objects.filter(
+            id__in=requested,
+            room__participants=request.user
+        ).exclude(
+            sender=request.user
+        ).annotate(
+            current_status=Subquery(
+                MessageStatus.objects.filter(
+                    message=OuterRef('pk'), user=request.user
+                ).values('status')[:1]
+            )
+        ).values_list('id', 'room_id', 'created_at', 'current_status')
+        
+        statuses = []
+        by_room = {}
+        read_up_to = {}
+        for message_id, room_id, created_at, current_status in messages:
+            new_status = requested[message_id]
+            if current_status and rank[new_status] <= rank[current_status]:
+                continue  # Ignore repeats and downgrades such as read -> delivered
+            statuses.append(MessageStatus(
+                message_id=message_id, user=request.user, status=new_status
+            ))
+            by_room.setdefault(room_id, []).append({
+                'message_id': message_id, 'status': new_status
+            })
+            if new_status == 'read':
+                read_up_to[room_id] = max(created_at, read_up_to.get(room_id, created_at))
+        
+        # The status read above may be stale by now, so existing rows are
+        # only moved forward by the UPDATE's own rank check: a delivered
+        # receipt racing a read one can never win.
+        upgrades = {}
+        for receipt in statuses:
+            upgrades.setdefault(receipt.status, []).append(receipt.message_id)
+        now = timezone.now()
+        with transaction.atomic():
+            MessageStatus.objects.bulk_create(statuses, ignore_conflicts=True)
+            for new_status, message_ids in upgrades.items():
+                MessageStatus.objects.filter(
+                    user=request.user,
+                    message_id__in=message_ids,
+                    status__in=[lower for lower in rank if rank[lower] < rank[new_status]]
+                ).update(status=new_status, timestamp=now)
+            for room_id, read_at in read_up_to.items():
+                RoomParticipant.advance_read_watermark(room_id, request.user, read_at)
+        
+        # One coalesced notification per affected room
+        for room_id, receipts in by_room.items():
+            broadcast_to_room(room_id, {
+                'type': 'chat.receipts',
+                'user_id': request.user.id,
+                'receipts': receipts,
+            })
+        
+        return Response({
+            'accepted': len(statuses),
+            'ignored': len(requested) - len(statuses)
+        })
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Cross-room delta sync for reconnecting clients.
+
+    GET /api/chat/sync/?since=<cursor> replays every change after the
+    cursor across the user's rooms. Without ``since`` it only returns the
+    current cursor, to be stored after a full load.
+
+    Ids are handed out at insert but become visible at commit, so a lower
+    id can appear after a higher one. The cursor therefore never moves
+    past a change younger than commit_lag; those are replayed on the next
+    sync (live ones arrive over the socket meanwhile). Rooms the user
+    left or that were deleted are not replayed; the room list drops them.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
+    max_changes = 500
+    # Must exceed the longest transaction that writes a RoomChange
+    commit_lag = timedelta(seconds=5)
+    
+    def list(self, request):
+        user = request.user
+        since = request.query_params.get('since')
+        
+        cutoff = timezone.now() - self.commit_lag
+        if since is None:
+            latest = RoomChange.objects.filter(
+                created_at__lt=cutoff
+            ).order_by('-id').values_list('id', flat=True).first()
+            return Response({'cursor': str(latest or 0), 'has_more': False})
+        
+        try:
+            since = int(since)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        my_rooms = RoomParticipant.objects.filter(user=user).values('room_id')
+        changes = list(
+            RoomChange.objects.filter(
+                room_id__in=my_rooms, id__gt=since
+            ).order_by('id')[:self.max_changes + 1]
         )
+        has_more = len(changes) > self.max_changes
+        changes = changes[:self.max_changes]
+        # Stop before the first change that may still have uncommitted lower ids around it
+        for index, change in enumerate(changes):
+            if change.created_at >= cutoff:
+                changes, has_more = changes[:index], False
+                break
+        
+        message_ids = set()
+        memberships = []
+        read_pairs = set()
+        for change in changes:
+            if change.message_id:
+                message_ids.add(change.message_id)
+            elif change.change_type == 'read':
+                read_pairs.add((change.room_id, change.user_id))
+            else:
+                memberships.append(change)
+        
+        # Latest state of each touched message, edits and soft deletes included
+        messages = list(Message.objects.filter(id__in=message_ids).select_related(
+            'sender', 'reply_to__sender'
+        ).order_by('created_at'))
+        
+        read_watermarks = [
+            {'room_id': room_id, 'user_id': user_id, 'last_read_at': last_read_at}
+            for room_id, user_id, last_read_at in RoomParticipant.objects.filter(
+                room_id__in={room_id for room_id, _ in read_pairs},
+                user_id__in={user_id for _, user_id in read_pairs}
+            ).values_list('room_id', 'user_id', 'last_read_at')
+            if (room_id, user_id) in read_pairs
+        ]
+        
+        return Response({
+            'cursor': str(changes[-1].id if changes else since),
+            'has_more': has_more,
+            'messages': [
+                {'room_id': message.room_id, **message_data}
+                for message, message_data in zip(
+                    messages, MessageSerializer(messages, many=True).data
+                )
+            ],
+            'memberships': [
+                {
+                    'room_id': change.room_id,
+                    'user_id': change.user_id,
+                    'change_type': change.change_type,
+                    'created_at': change.created_at,
+                }
+                for change in memberships
+            ],
+            'read_watermarks': read_watermarks,
+        })
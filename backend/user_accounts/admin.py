@@ -5,7 +5,7 @@ from .models import User, TwoFactorCode, Contact
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_online', 'twofa_enabled', 'date_joined')
-    list_filter = ('is_online', 'twofa_enabled', 'is_staff', 'is_active')
+    list_filter = ('twofa_enabled', 'is_staff', 'is_active')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-date_joined',)
     
@@ -17,7 +17,7 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('twofa_enabled', 'twofa_secret')
         }),
         ('Status', {
-            'fields': ('is_online', 'last_seen')
+            'fields': ('last_seen',)
         }),
         ('Privacy', {
             'fields': ('show_last_seen', 'show_status_to')
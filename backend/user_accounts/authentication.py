@@ -0,0 +1,62 @@
+"""
+Bearer token authentication for the API and WebSocket handshakes.
+
+Tokens are simplejwt access tokens: their signature and expiry are
+checked in memory and users come from user_cache, so a request with a
+warm cache makes no authentication query.
+"""
+
+from urllib.parse import parse_qs
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import user_cache
+
+def token_pair(user):
+    refresh = RefreshToken.for_user(user)
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = user_cache.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+def user_for_token(raw_token):
+    """The active user a raw access token belongs to, or None"""
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+class JWTAuthMiddleware:
+    """
+    Authenticate sockets from a ?token= query parameter.
+
+    Browsers cannot set headers on a WebSocket handshake, so the access
+    token travels in the URL. Connections without one, or with one that
+    no longer validates, fall back to the session cookie.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.session_inner = AuthMiddlewareStack(inner)
+
+    async def __call__(self, scope, receive, send):
+        tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        user = await database_sync_to_async(user_for_token)(tokens[0]) if tokens else None
+        if user is None:
+            return await self.session_inner(scope, receive, send)
+        return await self.inner({**scope, 'user': user}, receive, send)
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from . import user_cache
+from .models import User
+
+# PBKDF2 holds the GIL only briefly, so these threads verify in parallel
+password_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password')
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose per-request user lookup is served from user_cache.
+
+    Passwords are checked by EmailBackend alone, so a failed login costs
+    one hash rather than one per listed backend.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        return None
+
+    def get_user(self, user_id):
+        user = user_cache.get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+class EmailBackend(CachedModelBackend):
+    """Authenticate by email or username in one query, with a non-blocking variant for async views"""
+
+    def user_for_login(self, identifier):
+        if not identifier:
+            return None
+        field = 'email' if '@' in identifier else 'username'
+        return User._default_manager.filter(**{field: identifier}).first()
+
+    def verify(self, user, password):
+        """
+        Check password against user, or burn the same time when user is None.
+
+        Returns (matched, new_hash); new_hash is set when the stored hash
+        uses an outdated hasher or work factor.
+        """
+        if user is None:
+            # Same cost as a real check, so timing does not reveal which emails exist
+            make_password(password)
+            return False, None
+        rehashed = []
+        matched = check_password(password, user.password, setter=rehashed.append)
+        return matched, make_password(password) if matched and rehashed else None
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        user = self.user_for_login(email or username or kwargs.get(User.USERNAME_FIELD))
+        if password is None:
+            return None
+        matched, new_hash = self.verify(user, password)
+        if not matched or not self.user_can_authenticate(user):
+            return None
+        if new_hash:
+            self.store_hash(user, new_hash)
+        return user
+
+    def store_hash(self, user, new_hash):
+        user.password = new_hash
+        user.save(update_fields=['password'])
+
+    async def aauthenticate(self, request, username=None, password=None, email=None, **kwargs):
+        """authenticate() for async views: hashing runs on password_pool, not the event loop"""
+        user = await sync_to_async(self.user_for_login)(email or username or kwargs.get(User.USERNAME_FIELD))
+        if password is None:
+            return None
+        matched, new_hash = await asyncio.get_running_loop().run_in_executor(
+            password_pool, self.verify, user, password
+        )
+        if not matched or not self.user_can_authenticate(user):
+            return None
+        if new_hash:
+            await sync_to_async(self.store_hash)(user, new_hash)
+        return user
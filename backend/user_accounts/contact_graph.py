@@ -0,0 +1,90 @@
+"""
+Cached contact graph for privacy and feed checks.
+
+For each user the cache holds four frozensets of user ids:
+``contacts`` (people they added, not blocked), ``contacted_by`` (people
+who added them, not blocked), ``blocked`` and ``blocked_by``. Entries
+are keyed by a per-user version that Contact signals bump after commit,
+so a reader that loaded the database just before a change can never
+repopulate stale data under the current version.
+"""
+
+import time
+from django.core.cache import cache
+from .models import Contact
+
+GRAPH_TTL = 60 * 60
+
+def version_key(user_id):
+    return f'contact_graph:version:{user_id}'
+
+def entry_key(user_id, version):
+    return f'contact_graph:{user_id}:{version}'
+
+def bump(*user_ids):
+    """Invalidate the cached graph of each user"""
+    for user_id in user_ids:
+        key = version_key(user_id)
+        # A nanosecond seed keeps a version lost to eviction from colliding
+        if not cache.add(key, time.time_ns(), None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+
+def load(user_ids):
+    """Read graphs for user_ids from the database, in two queries"""
+    loaded = {
+        user_id: {'contacts': set(), 'contacted_by': set(), 'blocked': set(), 'blocked_by': set()}
+        for user_id in user_ids
+    }
+    for user_id, contact_id, is_blocked in Contact.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', 'contact_id', 'blocked'):
+        loaded[user_id]['blocked' if is_blocked else 'contacts'].add(contact_id)
+    for contact_id, user_id, is_blocked in Contact.objects.filter(
+        contact_id__in=user_ids
+    ).values_list('contact_id', 'user_id', 'blocked'):
+        loaded[contact_id]['blocked_by' if is_blocked else 'contacted_by'].add(user_id)
+
+    return {
+        user_id: {name: frozenset(ids) for name, ids in graph.items()}
+        for user_id, graph in loaded.items()
+    }
+
+def graphs(user_ids):
+    """Graphs for many users: two cache round trips, plus the database for misses"""
+    user_ids = list(user_ids)
+    versions = cache.get_many([version_key(user_id) for user_id in user_ids])
+    for user_id in user_ids:
+        if version_key(user_id) not in versions:
+            cache.add(version_key(user_id), time.time_ns(), None)
+            versions[version_key(user_id)] = cache.get(version_key(user_id))
+
+    keys = {entry_key(user_id, versions[version_key(user_id)]): user_id for user_id in user_ids}
+    found = {keys[key]: graph for key, graph in cache.get_many(keys).items()}
+
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        loaded = load(missing)
+        cache.set_many({
+            entry_key(user_id, versions[version_key(user_id)]): graph
+            for user_id, graph in loaded.items()
+        }, GRAPH_TTL)
+        found.update(loaded)
+    return found
+
+def graph_for(user_id):
+    return graphs([user_id])[user_id]
+
+def contacts(user_id):
+    return graph_for(user_id)['contacts']
+
+def contacted_by(user_id):
+    return graph_for(user_id)['contacted_by']
+
+def blocked(user_id):
+    return graph_for(user_id)['blocked']
+
+def blocked_by(user_id):
+    return graph_for(user_id)['blocked_by']
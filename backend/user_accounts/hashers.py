@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the work factor taken from PASSWORD_PBKDF2_ITERATIONS.
+
+    It shares the pbkdf2_sha256 algorithm name, so existing hashes still
+    verify. A successful login rehashes any password stored with a
+    different iteration count.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
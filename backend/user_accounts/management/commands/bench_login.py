@@ -0,0 +1,63 @@
+import asyncio
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from config.benches import BenchCommand
+from user_accounts.backends import EmailBackend
+
+User = get_user_model()
+
+class Command(BenchCommand):
+    help = (
+        'Measure async login throughput and event loop stalls for one or '
+        'more PBKDF2 work factors'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument(
+            '--iterations', type=int, nargs='+',
+            help='PBKDF2 iteration counts to compare (default: the configured one)'
+        )
+
+    def bench(self, *args, **options):
+        stamp = int(time.time() * 1000)
+        email = f'bench-{stamp}@example.invalid'
+        user = User.objects.create_user(username=f'bench-{stamp}', email=email)
+        workers = settings.PASSWORD_HASH_WORKERS
+        for iterations in options['iterations'] or [settings.PASSWORD_PBKDF2_ITERATIONS]:
+            with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations):
+                user.set_password('bench-password')
+                user.save(update_fields=['password'])
+                rate, stall = asyncio.run(self.run(email, options['logins'], options['concurrency']))
+            self.stdout.write(
+                f'{iterations:,} iterations: {rate:,.1f} logins/s '
+                f'({rate / workers:,.1f} per hashing thread, {workers} threads), '
+                f'longest event loop stall {stall:.1f} ms'
+            )
+
+    async def run(self, email, count, concurrency):
+        backend = EmailBackend()
+        slots = asyncio.Semaphore(concurrency)
+        stalls = [0.0]
+
+        async def login():
+            async with slots:
+                user = await backend.aauthenticate(None, email=email, password='bench-password')
+                assert user is not None
+
+        async def watch_loop():
+            # A blocked loop shows up as a late wake-up
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                stalls[0] = max(stalls[0], (time.perf_counter() - started) * 1000 - 1)
+
+        watcher = asyncio.create_task(watch_loop())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(count)))
+        elapsed = time.perf_counter() - started
+        watcher.cancel()
+        return count / elapsed, stalls[0]
@@ -0,0 +1,51 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from config.benches import BenchCommand
+from user_accounts import user_cache
+
+User = get_user_model()
+
+SETUPS = {
+    'database sessions, uncached users': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'cached sessions, cached users': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['user_accounts.backends.CachedModelBackend'],
+    },
+}
+
+class Command(BenchCommand):
+    help = 'Measure session-authenticated GET /api/accounts/me/ throughput with and without the auth caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def bench(self, *args, **options):
+        stamp = int(time.time() * 1000)
+        user = User.objects.create_user(username=f'bench-{stamp}', email=f'bench-{stamp}@example.invalid')
+        for label, overrides in SETUPS.items():
+            with override_settings(**overrides):
+                rate, queries = self.run(user, options['requests'])
+            self.stdout.write(f'{label}: {rate:,.0f} req/s, {queries:.1f} queries/request')
+
+    def run(self, user, count):
+        cache.clear()
+        user_cache.local.clear()
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        # Warm-up request fills whichever caches are in play
+        client.get('/api/accounts/me/')
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                response = client.get('/api/accounts/me/')
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - started
+        return count / elapsed, len(queries.captured_queries) / count
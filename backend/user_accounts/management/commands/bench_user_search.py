@@ -0,0 +1,90 @@
+import random
+import statistics
+import string
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from config.benches import BenchCommand
+from user_accounts.models import UserSearchToken
+from user_accounts.search import search_users, tokens_for
+
+User = get_user_model()
+
+SYLLABLES = ['an', 'ka', 'ri', 'so', 'mel', 'tor', 'vi', 'jo', 'ne', 'sha', 'lu', 'da', 'mi', 'ek', 'pa']
+
+class Command(BenchCommand):
+    help = (
+        'Measure people-search latency over a generated user table in a '
+        'scratch database, against an icontains scan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--scan-queries', type=int, default=5, help='icontains queries for comparison')
+        parser.add_argument('--batch', type=int, default=5000)
+
+    def bench(self, *args, **options):
+        stamp = int(time.time() * 1000)
+        prefix = f'bench-{stamp}-'
+        rng = random.Random(stamp)
+        names = []
+
+        started = time.perf_counter()
+        for start in range(0, options['users'], options['batch']):
+            users = []
+            for i in range(start, min(start + options['batch'], options['users'])):
+                first, last = self.name(rng), self.name(rng)
+                users.append(User(
+                    id=uuid.uuid4(), username=f'{prefix}{i}', email=f'{first}.{last}{i}@example.invalid',
+                    first_name=first.title(), last_name=last.title(), password='!'
+                ))
+                names.append((first, last))
+            # bulk_create skips save(), so tokens are written alongside
+            User.objects.bulk_create(users)
+            UserSearchToken.objects.bulk_create([
+                UserSearchToken(user_id=user.id, token=token)
+                for user in users for token in tokens_for(user)
+            ])
+        self.stdout.write(f'generated {options["users"]:,} users in {time.perf_counter() - started:.0f} s')
+        if not names:
+            return
+
+        viewer = User.objects.get(username=f'{prefix}0')
+        queries = []
+        for _ in range(options['queries']):
+            first, last = rng.choice(names)
+            queries.append(rng.choice([
+                first[:rng.randint(2, len(first))],
+                f'{first} {last[:rng.randint(1, len(last))]}',
+                last,
+            ]))
+
+        latencies, found = [], 0
+        for query in queries:
+            began = time.perf_counter()
+            found += bool(search_users(query, viewer))
+            latencies.append((time.perf_counter() - began) * 1000)
+        if latencies:
+            self.stdout.write(self.summary('token index', latencies) + f', {found}/{len(queries)} with results')
+
+        scans = []
+        for query in queries[:options['scan_queries']]:
+            began = time.perf_counter()
+            list(User.objects.filter(
+                Q(username__icontains=query) | Q(email__icontains=query) |
+                Q(first_name__icontains=query) | Q(last_name__icontains=query)
+            )[:20])
+            scans.append((time.perf_counter() - began) * 1000)
+        if scans:
+            self.stdout.write(self.summary('icontains scan', scans))
+
+    def name(self, rng):
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) + rng.choice(string.ascii_lowercase)
+
+    def summary(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+        return f'{label}: p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms'
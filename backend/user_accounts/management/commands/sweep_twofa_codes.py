@@ -0,0 +1,9 @@
+from config.batches import SweepCommand
+from user_accounts import twofa
+
+class Command(SweepCommand):
+    help = 'Delete expired two-factor codes in batches; run from cron every few minutes'
+    noun = 'expired two-factor codes'
+
+    def sweep(self, batch_size):
+        return twofa.sweep(batch_size)
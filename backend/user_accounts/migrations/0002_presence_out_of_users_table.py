@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='is_online',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:34
+
+from django.db import migrations, models
+
+from user_accounts.phone import normalize, phone_hash
+
+
+def backfill_phone_e164(apps, schema_editor):
+    User = apps.get_model('user_accounts', 'User')
+    batch = []
+    for user in User.objects.exclude(phone_number__isnull=True).exclude(
+        phone_number=''
+    ).only('id', 'phone_number').iterator(chunk_size=2000):
+        user.phone_e164 = normalize(user.phone_number)
+        if user.phone_e164:
+            user.phone_hash = phone_hash(user.phone_e164)
+            batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ['phone_e164', 'phone_hash'])
+            batch = []
+    User.objects.bulk_update(batch, ['phone_e164', 'phone_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_accounts', '0002_presence_out_of_users_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_phone_e164, migrations.RunPython.noop),
+    ]
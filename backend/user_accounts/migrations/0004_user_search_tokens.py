@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from user_accounts.search import tokens_for
+
+
+def backfill_search_tokens(apps, schema_editor):
+    User = apps.get_model('user_accounts', 'User')
+    UserSearchToken = apps.get_model('user_accounts', 'UserSearchToken')
+    batch = []
+    for user in User.objects.only(
+        'id', 'username', 'first_name', 'last_name', 'email'
+    ).iterator(chunk_size=2000):
+        batch += [UserSearchToken(user_id=user.id, token=token) for token in tokens_for(user)]
+        if len(batch) >= 2000:
+            UserSearchToken.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    UserSearchToken.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_accounts', '0003_user_phone_e164'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'user_search_tokens',
+                'indexes': [models.Index(fields=['token', 'user'], name='user_search_token_idx')],
+                'unique_together': {('user', 'token')},
+            },
+        ),
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_accounts', '0004_user_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='twofactorcode',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='twofactorcode',
+            index=models.Index(condition=models.Q(('used_at__isnull', True)), fields=['user', 'purpose', '-created_at'], name='twofa_active_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twofactorcode',
+            index=models.Index(fields=['expires_at'], name='twofa_expires_idx'),
+        ),
+    ]
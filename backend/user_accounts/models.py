@@ -5,6 +5,7 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
+from . import phone, presence, search
 
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -12,6 +13,9 @@ class User(AbstractUser):
     avatar = models.URLField(blank=True, null=True)
     bio = models.CharField(max_length=200, blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
+    # Derived from phone_number on save; what contact discovery matches on
+    phone_e164 = models.CharField(max_length=16, blank=True, null=True, db_index=True, editable=False)
+    phone_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, editable=False)
     
     # Override groups and user_permissions with unique related_name to avoid clashes
     groups = models.ManyToManyField(
@@ -35,9 +39,8 @@ class User(AbstractUser):
     twofa_enabled = models.BooleanField(default=False)
     twofa_secret = models.CharField(max_length=32, blank=True, null=True)
     
-    # Status tracking
-    is_online = models.BooleanField(default=False)
-    last_seen = models.DateTimeField(auto_now=True)
+    # Written by the presence service, not on every save
+    last_seen = models.DateTimeField(default=timezone.now)
     
     # Privacy settings
     show_last_seen = models.CharField(
@@ -73,14 +76,23 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'phone_number' in update_fields:
+            self.phone_e164 = phone.normalize(self.phone_number)
+            self.phone_hash = phone.phone_hash(self.phone_e164) if self.phone_e164 else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'phone_e164', 'phone_hash'}
+        super().save(*args, **kwargs)
+        if update_fields is None or search.INDEXED_FIELDS.intersection(update_fields):
+            search.reindex(self)
+    
     def generate_2fa_code(self):
         return ''.join(secrets.choice(string.digits) for _ in range(6))
     
-    def set_online_status(self, is_online):
-        self.is_online = is_online
-        if not is_online:
-            self.last_seen = timezone.now()
-        self.save(update_fields=['is_online', 'last_seen'])
+    @property
+    def is_online(self):
+        return presence.is_online(self.id)
 
 class TwoFactorCode(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='twofa_codes')
@@ -99,7 +111,15 @@ class TwoFactorCode(models.Model):
     
     class Meta:
         db_table = 'two_factor_codes'
-        unique_together = ['user', 'code', 'purpose']
+        indexes = [
+            # Latest unused code per (user, purpose): one probe at the head of the range
+            models.Index(
+                fields=['user', 'purpose', '-created_at'], name='twofa_active_latest_idx',
+                condition=models.Q(used_at__isnull=True)
+            ),
+            # Lets the sweeper find expired rows without a table scan
+            models.Index(fields=['expires_at'], name='twofa_expires_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -129,3 +149,13 @@ class Contact(models.Model):
     
     def __str__(self):
         return f"{self.user.username} -> {self.contact.username}"
+
+class UserSearchToken(models.Model):
+    """One normalised name/username token of a user, for prefix search"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    
+    class Meta:
+        db_table = 'user_search_tokens'
+        unique_together = ['user', 'token']
+        indexes = [models.Index(fields=['token', 'user'], name='user_search_token_idx')]
@@ -0,0 +1,35 @@
+"""
+Phone number normalisation for contact discovery.
+
+Numbers are reduced to E.164 (``+`` and up to 15 digits) so that an
+address book entry and a profile number compare equal regardless of
+spaces, dashes or an international ``00`` prefix. Numbers written in
+national form need a country calling code to become E.164; without one
+they are rejected rather than guessed.
+"""
+
+import hashlib
+import re
+from django.conf import settings
+
+FORMATTING = re.compile(r'[\s().\-/]')
+E164 = re.compile(r'^\+[1-9]\d{6,14}$')
+
+def normalize(number, calling_code=None):
+    """E.164 form of number, or None if it cannot be made into one"""
+    if not number:
+        return None
+    digits = FORMATTING.sub('', str(number))
+    if digits.startswith('00'):
+        digits = '+' + digits[2:]
+    elif not digits.startswith('+'):
+        calling_code = calling_code or getattr(settings, 'DEFAULT_COUNTRY_CALLING_CODE', None)
+        if not calling_code:
+            return None
+        # National numbers drop their trunk prefix after the country code
+        digits = f'+{calling_code}{digits.lstrip("0")}'
+    return digits if E164.match(digits) else None
+
+def phone_hash(e164):
+    """Hex SHA-256 of an E.164 number, as clients send for hashed discovery"""
+    return hashlib.sha256(e164.encode()).hexdigest()
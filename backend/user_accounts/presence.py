@@ -0,0 +1,68 @@
+"""
+Who is online, kept in the cache instead of the users table.
+
+Every open socket claims one of a user's MAX_CONNECTIONS slot keys with
+an atomic cache.add, and heartbeats push the key's expiry forward.
+Several devices can be online at once, and sockets from a crashed
+server simply lapse. No entry is read, modified and written back, so
+connections on different workers cannot overwrite each other. Each side
+writes its own slot before reading the others. Of two racing sockets,
+at least one sees the other, so a user is never left flipped offline
+while a socket is still up. last_seen reaches the database only at a
+user's final disconnect and every LAST_SEEN_INTERVAL seconds while a
+connection stays up.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+# Seconds a connection counts as online without a heartbeat
+PRESENCE_TTL = 90
+LAST_SEEN_INTERVAL = 300
+# Sockets tracked per user; more stay connected but share the others' presence
+MAX_CONNECTIONS = 8
+
+def slot_keys(user_id):
+    return [f'presence:{user_id}:{slot}' for slot in range(MAX_CONNECTIONS)]
+
+def live_slots(user_id):
+    """Slot key -> connection id for each of user_id's live connections"""
+    return cache.get_many(slot_keys(user_id))
+
+def connect(user_id, connection_id):
+    """Register or refresh a connection; True if it brought the user online"""
+    slots = live_slots(user_id)
+    for key, holder in slots.items():
+        if holder == connection_id and cache.touch(key, PRESENCE_TTL):
+            return False
+    for key in slot_keys(user_id):
+        if key not in slots and cache.add(key, connection_id, PRESENCE_TTL):
+            break
+    # Read after claiming, so a concurrent disconnect and this connect cannot both miss each other
+    return not any(holder != connection_id for holder in live_slots(user_id).values())
+
+def heartbeat(user_id, connection_id):
+    """Keep a connection alive; True if it had lapsed and the user was offline"""
+    return connect(user_id, connection_id)
+
+def disconnect(user_id, connection_id):
+    """Drop a connection; True if it was the user's last one"""
+    for key, holder in live_slots(user_id).items():
+        if holder == connection_id:
+            cache.delete(key)
+    return not live_slots(user_id)
+
+def online_user_ids(user_ids):
+    """The subset of user_ids that are online, in one cache round trip"""
+    keys = {key: user_id for user_id in user_ids for key in slot_keys(user_id)}
+    if not keys:
+        return set()
+    return {keys[key] for key in cache.get_many(keys)}
+
+def is_online(user_id):
+    return bool(online_user_ids([user_id]))
+
+def save_last_seen(user_id):
+    """Persist last_seen with a single-column UPDATE"""
+    get_user_model().objects.filter(id=user_id).update(last_seen=timezone.now())
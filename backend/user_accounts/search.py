@@ -0,0 +1,93 @@
+"""
+People search over the user_search_tokens side table.
+
+Names, usernames and email local parts are split into normalised tokens
+(case-folded, accents stripped). A query term matches a token it is a
+prefix of, via an index range scan (token >= term AND token < term +
+U+10FFFF), which every backend serves from a B-tree without LIKE.
+Results follow the token order of the first term's range scan, so an
+exact match ranks first and the other completions follow alphabetically
+("joanna" before "joe"). Further terms are checked in the same query
+with an EXISTS probe of each row's user on the (user, token) index.
+"""
+
+import re
+import unicodedata
+from django.db.models import Exists, OuterRef
+
+TOKEN_LENGTH = 64
+WORD = re.compile(r'\w+')
+# Tokens one user can have that share a prefix (first name, username, email...)
+TOKENS_PER_USER = 3
+MAX_TERMS = 4
+PREFIX_END = '\U0010ffff'
+INDEXED_FIELDS = {'username', 'first_name', 'last_name', 'email'}
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+def tokenize(text):
+    """Word tokens of text, plus the whole value when it has several words"""
+    text = normalize(text)
+    words = WORD.findall(text)
+    tokens = set(words)
+    joined = ''.join(text.split())
+    if len(words) > 1 and joined:
+        tokens.add(joined)
+    return {token[:TOKEN_LENGTH] for token in tokens if token}
+
+def tokens_for(user):
+    tokens = set()
+    for value in (user.username, user.first_name, user.last_name, (user.email or '').split('@')[0]):
+        tokens |= tokenize(value)
+    return tokens
+
+def reindex(user):
+    """Bring user's stored tokens in line with their current profile"""
+    from .models import UserSearchToken
+
+    wanted = tokens_for(user)
+    stored = set(UserSearchToken.objects.filter(user=user).values_list('token', flat=True))
+    if stored - wanted:
+        UserSearchToken.objects.filter(user=user, token__in=stored - wanted).delete()
+    if wanted - stored:
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user=user, token=token) for token in wanted - stored],
+            ignore_conflicts=True
+        )
+
+def query_terms(query):
+    """Distinct query terms in the order typed"""
+    terms = list(dict.fromkeys(WORD.findall(normalize(query))))
+    return [term[:TOKEN_LENGTH] for term in terms[:MAX_TERMS]]
+
+def prefix_range(term):
+    return {'token__gte': term, 'token__lt': term + PREFIX_END}
+
+def search_users(query, viewer, limit=20):
+    """Active users matching every term of query, best first, hiding blocks both ways"""
+    from . import contact_graph
+    from .models import User, UserSearchToken
+
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    graph = contact_graph.graph_for(viewer.id)
+    hidden = graph['blocked'] | graph['blocked_by'] | {viewer.id}
+
+    # Range scan on the first term; every other term must prefix some token of
+    # the same user. Blocks are excluded in SQL too, so the LIMIT only has to
+    # cover one user's duplicate tokens.
+    matches = UserSearchToken.objects.filter(**prefix_range(terms[0])).exclude(user_id__in=hidden)
+    for term in terms[1:]:
+        matches = matches.filter(Exists(UserSearchToken.objects.filter(
+            user_id=OuterRef('user_id'), **prefix_range(term)
+        )))
+    candidates = list(dict.fromkeys(
+        matches.order_by('token', 'user_id').values_list('user_id', flat=True)[:limit * TOKENS_PER_USER]
+    ))
+
+    users = User.objects.filter(id__in=candidates[:limit * 2], is_active=True).in_bulk()
+    return [users[user_id] for user_id in candidates if user_id in users][:limit]
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth import authenticate
+from . import presence, twofa
 from .models import User, Contact
 
 class UserSerializer(serializers.ModelSerializer):
@@ -14,10 +14,31 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'date_joined', 'last_seen']
 
+def prime_presence(context, user_ids):
+    """Look up presence for every user a response will show in one round trip"""
+    context.setdefault('online_user_ids', set()).update(presence.online_user_ids(user_ids))
+    return context
+
+class UserPublicListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        if 'online_user_ids' not in self.context:
+            prime_presence(self.context, [user.id for user in users])
+        return super().to_representation(users)
+
 class UserPublicSerializer(serializers.ModelSerializer):
+    is_online = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'avatar', 'bio', 'is_online']
+        list_serializer_class = UserPublicListSerializer
+    
+    def get_is_online(self, obj):
+        online_user_ids = self.context.get('online_user_ids')
+        if online_user_ids is None:
+            return obj.is_online
+        return obj.id in online_user_ids
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -46,35 +67,31 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 class LoginSerializer(serializers.Serializer):
+    """Shape of a login body; the async login view checks the password itself"""
+    email = serializers.EmailField()
+    password = serializers.CharField(style={'input_type': 'password'}, trim_whitespace=False)
+
+class TwoFactorVerifySerializer(serializers.Serializer):
     email = serializers.EmailField()
-    password = serializers.CharField(style={'input_type': 'password'})
+    code = serializers.CharField(max_length=6, min_length=6)
     
     def validate(self, attrs):
-        email = attrs.get('email')
-        password = attrs.get('password')
-        
-        if email and password:
-            user = authenticate(
-                request=self.context.get('request'),
-                username=email,
-                password=password
-            )
-            
-            if not user:
-                raise serializers.ValidationError('Invalid credentials.')
-            
-            if not user.is_active:
-                raise serializers.ValidationError('User account is disabled.')
-            
-            attrs['user'] = user
-        else:
-            raise serializers.ValidationError('Must include email and password.')
-        
+        user = User.objects.filter(email=attrs['email'], is_active=True).first()
+        if user is None or not twofa.verify(user, 'login', attrs['code']):
+            raise serializers.ValidationError('Invalid or expired code.')
+        attrs['user'] = user
         return attrs
 
-class TwoFactorVerifySerializer(serializers.Serializer):
-    email = serializers.EmailField()
+class TwoFactorCodeRequestSerializer(serializers.Serializer):
+    purpose = serializers.ChoiceField(choices=['enable_2fa', 'disable_2fa'])
+
+class TwoFactorConfirmSerializer(TwoFactorCodeRequestSerializer):
     code = serializers.CharField(max_length=6, min_length=6)
+    
+    def validate(self, attrs):
+        if not twofa.verify(self.context['request'].user, attrs['purpose'], attrs['code']):
+            raise serializers.ValidationError('Invalid or expired code.')
+        return attrs
 
 class ContactSerializer(serializers.ModelSerializer):
     contact = UserPublicSerializer(read_only=True)
@@ -90,3 +107,23 @@ class ContactSerializer(serializers.ModelSerializer):
         contact_user = User.objects.get(id=validated_data.pop('contact_id'))
         validated_data['contact'] = contact_user
         return super().create(validated_data)
+
+class ContactDiscoverSerializer(serializers.Serializer):
+    """Address book numbers, raw and/or as SHA-256 of their E.164 form"""
+    MAX_ENTRIES = 5000
+    
+    numbers = serializers.ListField(child=serializers.CharField(max_length=32), required=False, default=list)
+    hashes = serializers.ListField(
+        child=serializers.RegexField(r'^[0-9a-fA-F]{64}$'), required=False, default=list
+    )
+    # Applied to numbers written without one, e.g. '44'
+    country_code = serializers.RegexField(r'^[1-9]\d{0,2}$', required=False)
+    add_contacts = serializers.BooleanField(default=False)
+    
+    def validate(self, attrs):
+        total = len(attrs['numbers']) + len(attrs['hashes'])
+        if not total:
+            raise serializers.ValidationError('Provide numbers or hashes.')
+        if total > self.MAX_ENTRIES:
+            raise serializers.ValidationError(f'At most {self.MAX_ENTRIES} entries per request.')
+        return attrs
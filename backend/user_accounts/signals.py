@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import contact_graph, user_cache
+from .models import Contact, User
+
+@receiver([post_save, post_delete], sender=Contact)
+def invalidate_contact_graph(sender, instance, **kwargs):
+    # After commit, so readers never cache the pre-change rows under the new version
+    transaction.on_commit(lambda: contact_graph.bump(instance.user_id, instance.contact_id))
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    transaction.on_commit(lambda: user_cache.invalidate(instance.id))
@@ -1,3 +1,408 @@
-from django.test import TestCase
+import base64
+import re
+import time
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from django.utils import timezone
+from config import ratelimit
+from . import contact_graph, phone, presence, search, twofa
+from .backends import EmailBackend
+from .models import Contact, TwoFactorCode, User
+from .serializers import UserPublicSerializer
 
-# Create your tests here.
+class SessionLoginTests(TestCase):
+    def setUp(self):
+        ratelimit.reset()
+        self.user = User.objects.create_user(
+            username='alice', email='alice@example.com', password='s3cret-pass'
+        )
+        self.client = APIClient()
+
+    def test_login_with_email(self):
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'alice@example.com', 'password': 's3cret-pass',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['id'], str(self.user.id))
+
+    def test_wrong_password(self):
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'alice@example.com', 'password': 'nope',
+        })
+        self.assertEqual(response.status_code, 401)
+
+    def test_session_requests_are_served_from_caches(self):
+        self.client.force_login(self.user)
+        self.client.get('/api/accounts/me/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/accounts/me/').data['username'], 'alice')
+
+        # Saves reach this process's LRU too
+        self.user.username = 'alicia'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/api/accounts/me/').data['username'], 'alicia')
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        ratelimit.reset()
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            self.user = User.objects.create_user(
+                username='alice', email='alice@example.com', password='s3cret-pass'
+            )
+
+    def login(self, password='s3cret-pass'):
+        return self.client.post('/api/accounts/login/', {
+            'email': 'alice@example.com', 'password': password,
+        }, content_type='application/json')
+
+    def test_one_user_query_and_rehash_to_configured_cost(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000), CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.login().status_code, 200)
+        user_reads = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and '"users"' in q['sql']]
+        self.assertEqual(len(user_reads), 1)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertTrue(self.user.check_password('s3cret-pass'))
+
+    @override_settings(RATE_LIMITS={**settings.RATE_LIMITS, 'login_email': '2/min'})
+    def test_attempts_per_account_are_throttled(self):
+        self.assertEqual(self.login('nope').status_code, 401)
+        self.assertEqual(self.login('nope').status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 30)
+
+    @override_settings(RATE_LIMITS={**settings.RATE_LIMITS, 'login': '2/min'})
+    def test_forged_forwarded_for_does_not_escape_the_ip_bucket(self):
+        for number in range(2):
+            response = self.client.post('/api/accounts/login/', {
+                'email': f'user{number}@example.com', 'password': 'nope',
+            }, content_type='application/json', HTTP_X_FORWARDED_FOR=f'10.0.0.{number}')
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'user9@example.com', 'password': 'nope',
+        }, content_type='application/json', HTTP_X_FORWARDED_FOR='10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(RATE_LIMITS={**settings.RATE_LIMITS, 'login_email': '1/min'}, RATE_LIMIT_STORAGE='cache')
+    def test_shared_buckets_are_checked_off_the_event_loop(self):
+        with mock.patch('config.ratelimit.sync_to_async', wraps=ratelimit.sync_to_async) as offloaded:
+            self.assertEqual(self.login('nope').status_code, 401)
+            self.assertEqual(self.login().status_code, 429)
+        self.assertTrue(offloaded.called)
+        cache.clear()
+
+    def test_unknown_email_and_wrong_password(self):
+        self.assertEqual(self.login('nope').status_code, 401)
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'nobody@example.com', 'password': 's3cret-pass',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_malformed_bodies_are_rejected_not_crashed(self):
+        for body in ([1], {'email': 'nobody@example.com', 'password': ['x']}, {'email': 'alice@example.com'}):
+            response = self.client.post('/api/accounts/login/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'nobody@example.com', 'password': 123,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_failed_login_costs_one_hash(self):
+        with mock.patch('user_accounts.backends.check_password', return_value=False) as check:
+            self.assertIsNone(authenticate(username='alice@example.com', password='nope'))
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(authenticate(username='alice', password='s3cret-pass'), self.user)
+
+    def test_async_backend_accepts_username_like_the_sync_one(self):
+        user = async_to_sync(EmailBackend().aauthenticate)(None, username='alice@example.com', password='s3cret-pass')
+        self.assertEqual(user, self.user)
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        ratelimit.reset()
+        self.user = User.objects.create_user(
+            username='alice', email='alice@example.com', password='s3cret-pass'
+        )
+        self.client = APIClient()
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'alice@example.com', 'password': 's3cret-pass',
+        })
+        self.tokens = response.json()
+        # Token requests only; no session cookie
+        self.client = APIClient()
+
+    def test_bearer_token_needs_no_query_once_cached(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens["access"]}')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/accounts/me/').data['username'], 'alice')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/accounts/me/').status_code, 200)
+
+        self.user.first_name = 'Alicia'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/api/accounts/me/').data['first_name'], 'Alicia')
+
+    def test_refresh_and_rejection(self):
+        response = self.client.post('/api/accounts/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/api/accounts/me/').status_code, 200)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(self.client.get('/api/accounts/me/').status_code, 401)
+
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+
+    def test_online_until_last_device_disconnects(self):
+        self.assertTrue(presence.connect(self.alice.id, 'phone'))
+        self.assertFalse(presence.connect(self.alice.id, 'laptop'))
+        self.assertFalse(presence.disconnect(self.alice.id, 'phone'))
+        self.assertTrue(self.alice.is_online)
+        self.assertTrue(presence.disconnect(self.alice.id, 'laptop'))
+        self.assertFalse(self.alice.is_online)
+
+    def test_silent_connections_lapse(self):
+        presence.connect(self.alice.id, 'phone')
+        later = time.time() + presence.PRESENCE_TTL + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertFalse(self.alice.is_online)
+            self.assertTrue(presence.heartbeat(self.alice.id, 'phone'))
+            self.assertFalse(presence.connect(self.alice.id, 'laptop'))
+
+    def test_workers_never_overwrite_each_others_connections(self):
+        # Both devices saw no one online before claiming a slot (a connect race)
+        with mock.patch.object(presence, 'live_slots', side_effect=[{}, {}, {}, {}]):
+            presence.connect(self.alice.id, 'phone')
+            presence.connect(self.alice.id, 'laptop')
+        self.assertFalse(presence.disconnect(self.alice.id, 'phone'))
+        self.assertTrue(self.alice.is_online)
+        self.assertTrue(presence.disconnect(self.alice.id, 'laptop'))
+
+    def test_profile_saves_leave_last_seen_alone(self):
+        seen = self.alice.last_seen
+        self.alice.bio = 'hello'
+        self.alice.save()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.last_seen, seen)
+
+    def test_public_list_reads_presence_in_bulk(self):
+        presence.connect(self.bob.id, 'phone')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            data = UserPublicSerializer([self.alice, self.bob], many=True).data
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual([user['is_online'] for user in data], [False, True])
+
+class ContactGraphTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com')
+
+    def add_contact(self, user, contact, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Contact.objects.create(user=user, contact=contact, **kwargs)
+
+    def test_warm_reads_skip_the_database(self):
+        self.add_contact(self.alice, self.bob)
+        with self.assertNumQueries(2):
+            contact_graph.graphs([self.alice.id, self.bob.id])
+        with self.assertNumQueries(0):
+            self.assertIn(self.alice.id, contact_graph.contacted_by(self.bob.id))
+            self.assertEqual(contact_graph.contacts(self.alice.id), {self.bob.id})
+
+    def test_changes_invalidate_both_ends(self):
+        self.assertEqual(contact_graph.contacts(self.alice.id), set())
+        self.assertEqual(contact_graph.contacted_by(self.carol.id), set())
+
+        contact = self.add_contact(self.alice, self.carol)
+        self.assertEqual(contact_graph.contacts(self.alice.id), {self.carol.id})
+        self.assertEqual(contact_graph.contacted_by(self.carol.id), {self.alice.id})
+
+        contact.blocked = True
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.save()
+        self.assertEqual(contact_graph.blocked(self.alice.id), {self.carol.id})
+        self.assertEqual(contact_graph.contacted_by(self.carol.id), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.delete()
+        self.assertEqual(contact_graph.blocked(self.alice.id), set())
+
+class ContactDiscoveryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', phone_number='+44 20 7946 0018'
+        )
+        self.carol = User.objects.create_user(
+            username='carol', email='carol@example.com', phone_number='0044-20-7946-0019'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_numbers_are_stored_in_e164(self):
+        self.assertEqual(self.bob.phone_e164, '+442079460018')
+        self.assertEqual(self.carol.phone_e164, '+442079460019')
+        self.assertEqual(phone.normalize('020 7946 0018', '44'), '+442079460018')
+        self.assertIsNone(phone.normalize('020 7946 0018'))
+
+        self.bob.phone_number = None
+        self.bob.save(update_fields=['phone_number'])
+        self.bob.refresh_from_db()
+        self.assertIsNone(self.bob.phone_hash)
+
+    def test_matches_raw_and_hashed_numbers_in_chunks(self):
+        address_book = ['(020) 7946-0018', '+1 555 0100', 'not a number']
+        with mock.patch('user_accounts.views.DISCOVERY_CHUNK', 1), self.assertNumQueries(3):
+            response = self.client.post('/api/accounts/contacts/discover/', {
+                'numbers': address_book,
+                'hashes': [phone.phone_hash('+442079460019').upper()],
+                'country_code': '44',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(m.get('number') or m.get('hash')[:4], m['user']['username']) for m in response.data['matches']],
+            [('(020) 7946-0018', 'bob'), (phone.phone_hash('+442079460019')[:4].upper(), 'carol')]
+        )
+        self.assertFalse(Contact.objects.exists())
+
+    def test_can_add_matches_as_contacts(self):
+        self.assertEqual(contact_graph.contacts(self.alice.id), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(user=self.alice, contact=self.bob)
+        payload = {'numbers': ['+442079460018', '+442079460019'], 'add_contacts': True}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/accounts/contacts/discover/', payload, format='json')
+        self.assertEqual(response.data['contacts_added'], 1)
+        self.assertEqual(contact_graph.contacts(self.alice.id), {self.bob.id, self.carol.id})
+
+        response = self.client.post('/api/accounts/contacts/discover/', payload, format='json')
+        self.assertEqual(response.data['contacts_added'], 0)
+        self.assertEqual(Contact.objects.filter(user=self.alice).count(), 2)
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.renee = User.objects.create_user(
+            username='rbeaumont', email='renee.b@example.com', first_name='Renée', last_name='Beaumont'
+        )
+        self.rene = User.objects.create_user(
+            username='rene', email='rene@example.com', first_name='René', last_name='Roux'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def search(self, query):
+        return [user['username'] for user in self.client.get('/api/accounts/users/search/', {'q': query}).data]
+
+    def test_prefix_terms_ranked_exact_first(self):
+        self.assertEqual(self.search('RENE'), ['rene', 'rbeaumont'])
+        self.assertEqual(self.search('ren beau'), ['rbeaumont'])
+        self.assertEqual(self.search('alice'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_later_terms_filter_in_sql_not_after_a_cut(self):
+        User.objects.bulk_create([
+            User(username=f'smith{i}', email=f'smith{i}@example.com', last_name='Smith') for i in range(20)
+        ])
+        for user in User.objects.filter(last_name='Smith'):
+            search.reindex(user)
+        john = User.objects.create_user(username='jsmith', email='j@example.com', first_name='John', last_name='Smith')
+        self.assertEqual(search.search_users('smith john', self.alice, limit=2), [john])
+
+    def test_blocks_hide_users_both_ways(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(user=self.alice, contact=self.rene, blocked=True)
+            Contact.objects.create(user=self.renee, contact=self.alice, blocked=True)
+        self.assertEqual(self.search('ren'), [])
+
+    def test_renames_are_reindexed(self):
+        self.rene.first_name = 'Zoé'
+        self.rene.save(update_fields=['first_name'])
+        self.assertEqual(self.search('zoe'), ['rene'])
+        self.assertEqual(self.search('rene'), ['rene', 'rbeaumont'])
+        self.rene.username, self.rene.email = 'zroux', 'zoe@example.com'
+        self.rene.save()
+        self.assertEqual(self.search('rene'), ['rbeaumont'])
+
+class TwoFactorTests(TestCase):
+    def setUp(self):
+        ratelimit.reset()
+        self.user = User.objects.create_user(
+            username='alice', email='alice@example.com', password='s3cret-pass', twofa_enabled=True
+        )
+
+    def sent_code(self):
+        return re.search(r'\d{6}', mail.outbox[-1].body).group()
+
+    def test_login_waits_for_emailed_code(self):
+        response = self.client.post('/api/accounts/login/', {
+            'email': 'alice@example.com', 'password': 's3cret-pass',
+        }, content_type='application/json')
+        self.assertTrue(response.json()['twofa_required'])
+        self.assertEqual(self.client.get('/api/accounts/me/').status_code, 401)
+
+        verify = {'email': 'alice@example.com', 'code': self.sent_code()}
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(twofa.latest_active(self.user, 'login'))
+        response = self.client.post('/api/accounts/2fa/verify/', verify)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        self.assertEqual(self.client.get('/api/accounts/me/').status_code, 200)
+        # Single use
+        self.assertEqual(self.client.post('/api/accounts/2fa/verify/', verify).status_code, 400)
+
+    def test_basic_auth_cannot_skip_the_code(self):
+        credentials = base64.b64encode(b'alice@example.com:s3cret-pass').decode()
+        response = self.client.get('/api/accounts/me/', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_wrong_guesses_burn_the_code_without_row_writes(self):
+        code = twofa.issue(self.user, 'login')
+        wrong = '000000' if code.code != '000000' else '111111'
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(twofa.MAX_ATTEMPTS - 1):
+                self.assertFalse(twofa.verify(self.user, 'login', wrong))
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+
+        self.assertFalse(twofa.verify(self.user, 'login', wrong))
+        self.assertFalse(twofa.verify(self.user, 'login', code.code))
+
+    def test_new_code_retires_old_and_sweeper_deletes_expired(self):
+        with mock.patch.object(User, 'generate_2fa_code', side_effect=['111111', '222222']):
+            first = twofa.issue(self.user, 'login')
+            second = twofa.issue(self.user, 'login')
+        self.assertEqual(twofa.latest_active(self.user, 'login'), second)
+        self.assertFalse(twofa.verify(self.user, 'login', '111111'))
+
+        TwoFactorCode.objects.filter(id=first.id).update(expires_at=timezone.now() - timedelta(minutes=1))
+        with self.assertNumQueries(3):
+            self.assertEqual(twofa.sweep(batch_size=1), 1)
+        self.assertEqual(list(TwoFactorCode.objects.all()), [second])
+
+    def test_disable_with_code(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post('/api/accounts/2fa/code/', {'purpose': 'disable_2fa'}).status_code, 202)
+        response = self.client.post('/api/accounts/2fa/confirm/', {
+            'purpose': 'disable_2fa', 'code': self.sent_code(),
+        })
+        self.assertFalse(response.data['twofa_enabled'])
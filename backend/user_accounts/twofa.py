@@ -0,0 +1,70 @@
+"""
+Lifecycle of emailed two-factor codes.
+
+Issuing a code retires any earlier unused code for the same purpose, so
+the latest unused row per (user, purpose) is the only one that counts
+and is found by a single probe of twofa_active_latest_idx. Wrong guesses
+are counted in the cache rather than written to the row; after
+MAX_ATTEMPTS the code is burnt. sweep() deletes expired rows in chunks;
+used codes go with them once their ten minutes are up.
+"""
+
+import hmac
+from django.core.cache import cache
+from django.core.mail import send_mail
+from django.utils import timezone
+from config.batches import DEFAULT_BATCH, delete_in_batches
+from .models import TwoFactorCode
+
+MAX_ATTEMPTS = 5
+
+def attempts_key(code_id):
+    return f'twofa:attempts:{code_id}'
+
+def latest_active(user, purpose):
+    """The newest unused, unexpired code for user and purpose, or None"""
+    code = TwoFactorCode.objects.filter(
+        user=user, purpose=purpose, used_at__isnull=True
+    ).order_by('-created_at').first()
+    return code if code is not None and code.is_valid() else None
+
+def issue(user, purpose):
+    """Create and email a fresh code, retiring any earlier one"""
+    TwoFactorCode.objects.filter(user=user, purpose=purpose, used_at__isnull=True).update(
+        used_at=timezone.now()
+    )
+    code = TwoFactorCode.objects.create(user=user, purpose=purpose, code=user.generate_2fa_code())
+    send_mail(
+        'Your verification code',
+        f'Your code is {code.code}. It expires in 10 minutes.',
+        None,
+        [user.email],
+    )
+    return code
+
+def verify(user, purpose, submitted):
+    """Consume the active code if submitted matches it; False otherwise"""
+    code = latest_active(user, purpose)
+    if code is None:
+        return False
+
+    # Compare before counting, in constant time, so timing reveals no digits
+    if hmac.compare_digest(code.code.encode(), str(submitted).encode()):
+        code.mark_as_used()
+        cache.delete(attempts_key(code.id))
+        return True
+
+    key = attempts_key(code.id)
+    cache.add(key, 0, int((code.expires_at - timezone.now()).total_seconds()) + 1)
+    try:
+        attempts = cache.incr(key)
+    except ValueError:
+        attempts = 1
+    if attempts >= MAX_ATTEMPTS:
+        code.mark_as_used()
+    return False
+
+def sweep(batch_size=DEFAULT_BATCH):
+    """Delete expired codes in batches; returns the count"""
+    # Used codes expire within minutes too, so the indexed expiry range covers them
+    return delete_in_batches(TwoFactorCode.objects.filter(expires_at__lt=timezone.now()), batch_size)
@@ -1,11 +1,19 @@
 ﻿from django.urls import path
+from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
-    SessionLoginView, SessionLogoutView, SessionRegisterView, MeView
+    SessionLoginView, SessionLogoutView, SessionRegisterView, MeView,
+    ContactDiscoverView, UserSearchView, TwoFactorVerifyView, TwoFactorCodeView, TwoFactorConfirmView
 )
 
 urlpatterns = [
     path('login/', SessionLoginView.as_view(), name='login'),
     path('logout/', SessionLogoutView.as_view(), name='logout'),
     path('register/', SessionRegisterView.as_view(), name='register'),
+    path('2fa/verify/', TwoFactorVerifyView.as_view(), name='twofa-verify'),
+    path('2fa/code/', TwoFactorCodeView.as_view(), name='twofa-code'),
+    path('2fa/confirm/', TwoFactorConfirmView.as_view(), name='twofa-confirm'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('me/', MeView.as_view(), name='me'),
+    path('contacts/discover/', ContactDiscoverView.as_view(), name='contact-discover'),
+    path('users/search/', UserSearchView.as_view(), name='user-search'),
 ]
@@ -0,0 +1,80 @@
+"""
+Cache of User rows for request authentication.
+
+Session and token auth both need the user row on every request. Lookups
+go through a per-process LRU, then the shared cache, then the database.
+Entries in both caches live for at most USER_CACHE_TTL seconds. Any save
+or delete drops them after commit. Other processes keep their local
+copy until it expires, so profile edits can take up to the TTL to reach
+them.
+
+Callers get a copy, so a request that changes its user object cannot
+leak the change to later requests.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from .models import User
+
+USER_CACHE_TTL = 60
+LOCAL_CACHE_SIZE = 10_000
+
+def cache_key(user_id):
+    return f'user:{user_id}'
+
+class LocalUserCache:
+    """Thread-safe LRU of user_id -> (expires_at, user)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, user):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + USER_CACHE_TTL, user)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+local = LocalUserCache(LOCAL_CACHE_SIZE)
+
+def get_user(user_id):
+    """The user with user_id, or None if there is none"""
+    key = str(user_id)
+    user = local.get(key)
+    if user is None:
+        user = cache.get(cache_key(key))
+        if user is None:
+            user = User.objects.filter(id=user_id).first()
+            if user is None:
+                return None
+            cache.set(cache_key(key), user, USER_CACHE_TTL)
+        local.set(key, user)
+    return copy.copy(user)
+
+def invalidate(user_id):
+    local.delete(str(user_id))
+    cache.delete(cache_key(user_id))
@@ -1,29 +1,113 @@
-from django.contrib.auth import authenticate, login, logout
+import json
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.contrib.auth import alogin, login, logout
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from .serializers import UserSerializer, RegisterSerializer
+from config import ratelimit
+from . import contact_graph, twofa
+from .authentication import token_pair
+from .backends import EmailBackend
+from .models import Contact
+from .phone import normalize
+from .search import search_users
+from .serializers import (
+    UserSerializer, UserPublicSerializer, RegisterSerializer, LoginSerializer, ContactDiscoverSerializer,
+    TwoFactorVerifySerializer, TwoFactorCodeRequestSerializer, TwoFactorConfirmSerializer,
+    prime_presence
+)
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class SessionLoginView(APIView):
+# Ids per IN (...) clause when matching address books
+DISCOVERY_CHUNK = 500
+SEARCH_LIMIT = 20
+
+@method_decorator(csrf_exempt, name='dispatch')
+class SessionLoginView(View):
+    """
+    Email/password login as an async view.
+
+    The event loop only waits on the password check, which runs on the
+    bounded password_pool, so a login storm queues for hashing threads
+    instead of tying up every worker.
+    """
+
+    backend_path = 'user_accounts.backends.EmailBackend'
+
+    async def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'detail': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            data = request.POST
+
+        serializer = LoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        email, password = serializer.validated_data['email'], serializer.validated_data['password']
+
+        wait = max(
+            await ratelimit.limiter('login').acheck(ratelimit.client_ip(request)),
+            await ratelimit.limiter('login_email').acheck(email.lower())
+        )
+        if wait:
+            return ratelimit.too_many_requests(wait)
+
+        user = await EmailBackend().aauthenticate(request, email=email, password=password)
+        if user is None:
+            return JsonResponse({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if user.twofa_enabled:
+            # The session and tokens wait for the emailed code (TwoFactorVerifyView)
+            await sync_to_async(twofa.issue)(user, 'login')
+            return JsonResponse({'twofa_required': True, 'detail': 'Verification code sent'})
+
+        await alogin(request, user, backend=self.backend_path)
+        return JsonResponse({'user': UserSerializer(user).data, **token_pair(user)})
+
+
+class TwoFactorVerifyView(APIView):
+    """Second login step for accounts with 2FA: trade the emailed code for a session"""
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        email = request.data.get('email')
-        password = request.data.get('password')
-        try:
-            user_obj = User.objects.get(email=email)
-            username = user_obj.username
-        except User.DoesNotExist:
-            return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+        serializer = TwoFactorVerifySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        login(request, user, backend=SessionLoginView.backend_path)
+        return Response({'user': UserSerializer(user).data, **token_pair(user)})
+
+
+class TwoFactorCodeView(APIView):
+    """Email a code to confirm turning 2FA on or off"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = TwoFactorCodeRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        twofa.issue(request.user, serializer.validated_data['purpose'])
+        return Response({'detail': 'Verification code sent'}, status=status.HTTP_202_ACCEPTED)
+
+
+class TwoFactorConfirmView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
-        user = authenticate(request, username=username, password=password)
-        if user and user.is_active:
-            login(request, user)
-            return Response({'user': UserSerializer(user).data}, status=status.HTTP_200_OK)
-        return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+    def post(self, request):
+        serializer = TwoFactorConfirmSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        request.user.twofa_enabled = serializer.validated_data['purpose'] == 'enable_2fa'
+        request.user.save(update_fields=['twofa_enabled'])
+        return Response(UserSerializer(request.user).data)
 
 
 class SessionLogoutView(APIView):
@@ -42,9 +126,10 @@ class SessionRegisterView(APIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         # automatically log in new user
-        login(request, user)
+        login(request, user, backend=SessionLoginView.backend_path)
         return Response({
             'user': UserSerializer(user).data,
+            **token_pair(user),
             'message': 'Account created and logged in successfully'
         }, status=status.HTTP_201_CREATED)
 
@@ -54,3 +139,71 @@ class MeView(APIView):
 
     def get(self, request):
         return Response(UserSerializer(request.user).data)
+
+
+class ContactDiscoverView(APIView):
+    """Match an address book against registered phone numbers"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = ContactDiscoverSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # Canonical key -> the entries the client sent for it
+        by_number = defaultdict(list)
+        for number in data['numbers']:
+            e164 = normalize(number, data.get('country_code'))
+            if e164:
+                by_number[e164].append(number)
+        by_hash = defaultdict(list)
+        for value in data['hashes']:
+            by_hash[value.lower()].append(value)
+
+        users, matches = {}, []
+        for field, label, wanted in (
+            ('phone_e164', 'number', by_number), ('phone_hash', 'hash', by_hash)
+        ):
+            keys = list(wanted)
+            for start in range(0, len(keys), DISCOVERY_CHUNK):
+                found = User.objects.filter(
+                    **{f'{field}__in': keys[start:start + DISCOVERY_CHUNK]}, is_active=True
+                ).exclude(id=request.user.id)
+                for user in found:
+                    users[user.id] = user
+                    matches += [(label, entry, user.id) for entry in wanted[getattr(user, field)]]
+
+        added = 0
+        if data['add_contacts'] and users:
+            known = contact_graph.graph_for(request.user.id)
+            added = len(users.keys() - known['contacts'] - known['blocked'])
+            with transaction.atomic():
+                Contact.objects.bulk_create(
+                    [Contact(user=request.user, contact_id=user_id) for user_id in users],
+                    ignore_conflicts=True, batch_size=DISCOVERY_CHUNK
+                )
+                # bulk_create skips post_save, so the graph is invalidated here
+                transaction.on_commit(lambda: contact_graph.bump(request.user.id, *users))
+
+        context = prime_presence({'request': request}, users.keys())
+        profiles = {
+            profile['id']: profile
+            for profile in UserPublicSerializer(list(users.values()), many=True, context=context).data
+        }
+        return Response({
+            'matches': [
+                {label: entry, 'user': profiles[str(user_id)]}
+                for label, entry, user_id in matches
+            ],
+            'contacts_added': added,
+        })
+
+
+class UserSearchView(APIView):
+    """Find people by name, username or email prefix"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        users = search_users(request.query_params.get('q', ''), request.user, limit=SEARCH_LIMIT)
+        context = prime_presence({'request': request}, [user.id for user in users])
+        return Response(UserPublicSerializer(users, many=True, context=context).data)
@@ -0,0 +1,108 @@
+"""
+Per-viewer status feeds, materialised when a status is posted.
+
+Posting a status writes one StatusFeedEntry for each member of its
+audience:
+- 'everyone': people connected to the owner in either direction;
+- 'contacts': people the owner added;
+- 'custom': the StatusViewer list.
+Blocks in either direction are excluded. Reading a feed is then one
+range scan of status_feed_viewer_idx.
+
+An audience larger than FANOUT_LIMIT would make posting slow, so such a
+status gets no entries. It is flagged fanout_on_read and picked up at
+read time from the small partial index of live flagged statuses.
+
+Contacts can change while a status is live, so feed_for() rechecks
+owners against the viewer's cached contact graph in the same query.
+People who become contacts after a status was posted see that owner's
+next status.
+"""
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from config.batches import DEFAULT_BATCH, delete_in_batches
+from user_accounts import contact_graph
+from .models import StatusFeedEntry, StatusUpdate, StatusViewer
+
+FANOUT_LIMIT = 5000
+FANOUT_BATCH = 1000
+
+def audience(status):
+    """Ids of the users whose feeds should carry status"""
+    graph = contact_graph.graph_for(status.owner_id)
+    if status.visibility == 'everyone':
+        viewers = graph['contacts'] | graph['contacted_by']
+    elif status.visibility == 'contacts':
+        viewers = set(graph['contacts'])
+    else:
+        viewers = set(StatusViewer.objects.filter(status=status).values_list('user_id', flat=True))
+    return viewers - graph['blocked'] - graph['blocked_by'] - {status.owner_id}
+
+def fan_out(status):
+    """Deliver a new status to its audience's feeds, or flag it for fan-out-on-read"""
+    viewers = audience(status)
+    if len(viewers) > FANOUT_LIMIT:
+        status.fanout_on_read = True
+        status.save(update_fields=['fanout_on_read'])
+        return
+
+    with transaction.atomic():
+        StatusFeedEntry.objects.bulk_create([
+            StatusFeedEntry(
+                viewer_id=viewer_id, status=status, owner_id=status.owner_id,
+                visibility=status.visibility, created_at=status.created_at, expires_at=status.expires_at
+            )
+            for viewer_id in viewers
+        ], batch_size=FANOUT_BATCH, ignore_conflicts=True)
+
+def hidden_owners(graph):
+    """Owners a viewer has since blocked, been blocked by or lost as a contact, per visibility"""
+    return (
+        Q(owner_id__in=graph['blocked'] | graph['blocked_by'])
+        | Q(visibility='everyone') & ~Q(owner_id__in=graph['contacts'] | graph['contacted_by'])
+        | Q(visibility='contacts') & ~Q(owner_id__in=graph['contacted_by'])
+    )
+
+def delivered_entries(user, graph, now):
+    """The viewer's live entries: a range scan of status_feed_viewer_idx"""
+    return StatusFeedEntry.objects.filter(
+        viewer=user, expires_at__gt=now
+    ).exclude(hidden_owners(graph)).select_related('status__owner')
+
+def read_time_statuses(user, graph, now):
+    """Live fan-out-on-read statuses the viewer may see, from status_read_fanout_idx"""
+    return StatusUpdate.objects.filter(
+        fanout_on_read=True, expires_at__gt=now
+    ).exclude(owner=user).exclude(hidden_owners(graph)).exclude(
+        Q(visibility='custom') & ~Q(id__in=StatusViewer.objects.filter(user=user).values('status_id'))
+    ).select_related('owner').order_by()
+
+def feed_statuses(user):
+    """
+    The live statuses in user's feed, newest first.
+
+    Two indexed reads merged in Python, so neither visits other viewers'
+    statuses: the viewer's entries joined to their statuses by primary
+    key, and the small set of live fan-out-on-read statuses.
+    """
+    now = timezone.now()
+    graph = contact_graph.graph_for(user.id)
+    statuses = [entry.status for entry in delivered_entries(user, graph, now)]
+    statuses += read_time_statuses(user, graph, now)
+    statuses.sort(key=lambda status: status.created_at, reverse=True)
+    return statuses
+
+def feed_for(user, statuses):
+    """statuses narrowed to those in user's feed, for lookups of single statuses by id"""
+    graph = contact_graph.graph_for(user.id)
+    delivered = StatusFeedEntry.objects.filter(viewer=user, expires_at__gt=timezone.now()).values('status_id')
+    listed = StatusViewer.objects.filter(user=user).values('status_id')
+    return statuses.filter(
+        Q(id__in=delivered) | Q(fanout_on_read=True) & (~Q(visibility='custom') | Q(id__in=listed))
+    ).exclude(hidden_owners(graph))
+
+def sweep(batch_size=DEFAULT_BATCH):
+    """Delete feed entries of expired statuses in batches; returns the count"""
+    return delete_in_batches(StatusFeedEntry.objects.filter(expires_at__lte=timezone.now()), batch_size)
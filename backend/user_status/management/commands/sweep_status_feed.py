@@ -0,0 +1,9 @@
+from config.batches import SweepCommand
+from user_status import feed
+
+class Command(SweepCommand):
+    help = 'Delete feed entries of expired statuses in batches; run from cron hourly'
+    noun = 'expired status feed entries'
+
+    def sweep(self, batch_size):
+        return feed.sweep(batch_size)
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.6 on 2026-10-17 01:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def read_live_statuses_at_feed_time(apps, schema_editor):
+    # Statuses posted before feed inboxes have no entries; serve them the
+    # fan-out-on-read way until they expire instead of backfilling inboxes
+    StatusUpdate = apps.get_model('user_status', 'StatusUpdate')
+    StatusUpdate.objects.filter(expires_at__gt=timezone.now()).update(fanout_on_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_status', '0002_alter_statusupdate_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visibility', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'status_feed_entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='statusupdate',
+            name='fanout_on_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='statusupdate',
+            index=models.Index(condition=models.Q(('fanout_on_read', True)), fields=['expires_at'], name='status_read_fanout_idx'),
+        ),
+        migrations.AddField(
+            model_name='statusfeedentry',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='statusfeedentry',
+            name='status',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='user_status.statusupdate'),
+        ),
+        migrations.AddField(
+            model_name='statusfeedentry',
+            name='viewer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_feed', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='statusfeedentry',
+            index=models.Index(fields=['viewer', 'expires_at'], name='status_feed_viewer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statusfeedentry',
+            index=models.Index(fields=['expires_at'], name='status_feed_expires_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='statusfeedentry',
+            unique_together={('viewer', 'status')},
+        ),
+        migrations.RunPython(read_live_statuses_at_feed_time, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
-import uuid
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from config.ids import uuid7
+from user_accounts import contact_graph
 
 class StatusUpdate(models.Model):
     STATUS_TYPES = (
@@ -11,7 +12,7 @@ class StatusUpdate(models.Model):
         ('video', 'Video'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='status_updates')
     status_type = models.CharField(max_length=10, choices=STATUS_TYPES, default='text')
     
@@ -39,12 +40,19 @@ class StatusUpdate(models.Model):
     # Analytics
     view_count = models.PositiveIntegerField(default=0)
     
+    # Audience too large for feed inboxes; viewers' feeds query it at read time
+    fanout_on_read = models.BooleanField(default=False)
+    
     class Meta:
         db_table = 'status_updates'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['owner', '-created_at']),
             models.Index(fields=['expires_at']),
+            models.Index(
+                fields=['expires_at'], name='status_read_fanout_idx',
+                condition=models.Q(fanout_on_read=True)
+            ),
         ]
     
     def save(self, *args, **kwargs):
@@ -65,19 +73,14 @@ class StatusUpdate(models.Model):
     
     def can_view(self, user):
         """Check if user can view this status"""
-        if self.owner == user:
+        if self.owner_id == user.id:
             return True
         
         if self.visibility == 'everyone':
             return True
         elif self.visibility == 'contacts':
             # Check if user is in owner's contacts
-            from user_accounts.models import Contact
-            return Contact.objects.filter(
-                user=self.owner,
-                contact=user,
-                blocked=False
-            ).exists()
+            return user.id in contact_graph.contacts(self.owner_id)
         elif self.visibility == 'custom':
             return StatusViewer.objects.filter(
                 status=self,
@@ -96,6 +99,24 @@ class StatusViewer(models.Model):
         db_table = 'status_viewers'
         unique_together = ['status', 'user']
 
+class StatusFeedEntry(models.Model):
+    """A status delivered to one viewer's feed when it was posted"""
+    viewer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='status_feed')
+    status = models.ForeignKey(StatusUpdate, on_delete=models.CASCADE, related_name='feed_entries')
+    # Copied from the status so a feed read never touches status_updates to filter
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    visibility = models.CharField(max_length=10)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'status_feed_entries'
+        unique_together = ['viewer', 'status']
+        indexes = [
+            models.Index(fields=['viewer', 'expires_at'], name='status_feed_viewer_idx'),
+            models.Index(fields=['expires_at'], name='status_feed_expires_idx'),
+        ]
+
 class StatusView(models.Model):
     """Track status views for analytics"""
     status = models.ForeignKey(StatusUpdate, on_delete=models.CASCADE, related_name='views')
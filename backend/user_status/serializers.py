@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.utils import timezone
 from user_accounts.serializers import UserPublicSerializer
+from .feed import fan_out
 from .models import StatusUpdate, StatusView, StatusReaction, StatusViewer
 
 class StatusViewSerializer(serializers.ModelSerializer):
@@ -38,6 +40,9 @@ class StatusUpdateSerializer(serializers.ModelSerializer):
     def get_has_viewed(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            # The feed prefetches views, so answer from them instead of one query per status
+            if 'views' in getattr(obj, '_prefetched_objects_cache', {}):
+                return any(view.viewer_id == request.user.id for view in obj.views.all())
             return StatusView.objects.filter(
                 status=obj,
                 viewer=request.user
@@ -78,20 +83,23 @@ class CreateStatusSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         custom_viewer_ids = validated_data.pop('custom_viewer_ids', [])
         
-        status = StatusUpdate.objects.create(
-            owner=self.context['request'].user,
-            **validated_data
-        )
-        
-        # Add custom viewers if visibility is custom
-        if status.visibility == 'custom' and custom_viewer_ids:
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
+        # A status never goes live without its viewers and feed entries
+        with transaction.atomic():
+            status = StatusUpdate.objects.create(
+                owner=self.context['request'].user,
+                **validated_data
+            )
             
-            viewers = User.objects.filter(id__in=custom_viewer_ids)
-            for viewer in viewers:
-                StatusViewer.objects.create(status=status, user=viewer)
-        
+            # Add custom viewers if visibility is custom
+            if status.visibility == 'custom' and custom_viewer_ids:
+                from django.contrib.auth import get_user_model
+                User = get_user_model()
+                
+                viewers = User.objects.filter(id__in=custom_viewer_ids)
+                for viewer in viewers:
+                    StatusViewer.objects.create(status=status, user=viewer)
+            
+            fan_out(status)
         return status
 
 class StatusReactionCreateSerializer(serializers.ModelSerializer):
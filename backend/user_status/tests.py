@@ -1,3 +1,137 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from user_accounts import contact_graph
+from user_accounts.models import Contact
+from . import feed
+from .models import StatusFeedEntry, StatusUpdate
 
-# Create your tests here.
+User = get_user_model()
+
+class ContactStatusFeedTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com')
+        self.fan = User.objects.create_user(username='fan', email='fan@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(user=self.owner, contact=self.friend)
+            Contact.objects.create(user=self.fan, contact=self.owner)
+        self.status = StatusUpdate.objects.create(owner=self.owner, text='hi', visibility='contacts')
+        feed.fan_out(self.status)
+        self.client = APIClient()
+
+    def feed_ids(self, user):
+        self.client.force_authenticate(user)
+        return [item['id'] for item in self.client.get('/api/status/').data]
+
+    def test_feed_matches_can_view(self):
+        # Only people the owner added see a contacts-only status
+        self.assertTrue(self.status.can_view(self.friend))
+        self.assertFalse(self.status.can_view(self.fan))
+        self.assertEqual(self.feed_ids(self.friend), [str(self.status.id)])
+        self.assertEqual(self.feed_ids(self.fan), [])
+
+class FanOutFeedTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com')
+        self.friend = User.objects.create_user(username='friend', email='friend@example.com')
+        self.fan = User.objects.create_user(username='fan', email='fan@example.com')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.create(user=self.owner, contact=self.friend)
+            Contact.objects.create(user=self.fan, contact=self.owner)
+        self.client = APIClient()
+
+    def post(self, **data):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post('/api/status/', {'status_type': 'text', 'text': 'hi', **data}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return StatusUpdate.objects.filter(owner=self.owner).latest('created_at')
+
+    def feed_ids(self, user):
+        self.client.force_authenticate(user)
+        return [item['id'] for item in self.client.get('/api/status/').data]
+
+    def test_posting_writes_entries_for_the_audience(self):
+        status = self.post(visibility='everyone')
+        self.assertEqual(
+            set(StatusFeedEntry.objects.filter(status=status).values_list('viewer_id', flat=True)),
+            {self.friend.id, self.fan.id}
+        )
+        self.assertEqual(self.feed_ids(self.fan), [str(status.id)])
+        self.assertEqual(self.feed_ids(self.stranger), [])
+
+    def test_custom_audience(self):
+        status = self.post(visibility='custom', custom_viewer_ids=[str(self.stranger.id)])
+        self.assertEqual(self.feed_ids(self.stranger), [str(status.id)])
+        self.assertEqual(self.feed_ids(self.friend), [])
+
+    def test_block_after_posting_hides_entry(self):
+        status = self.post(visibility='everyone')
+        self.assertEqual(self.feed_ids(self.friend), [str(status.id)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Contact.objects.filter(user=self.owner, contact=self.friend).update(blocked=True)
+            contact_graph.bump(self.owner.id, self.friend.id)
+        self.assertEqual(self.feed_ids(self.friend), [])
+
+    def test_large_audience_is_read_at_feed_time(self):
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 1):
+            status = self.post(visibility='everyone')
+            custom = self.post(visibility='custom', custom_viewer_ids=[str(self.stranger.id), str(self.fan.id)])
+        status.refresh_from_db()
+        self.assertTrue(status.fanout_on_read)
+        self.assertFalse(StatusFeedEntry.objects.filter(status__owner=self.owner).exists())
+        self.assertEqual(self.feed_ids(self.friend), [str(status.id)])
+        self.assertEqual(set(self.feed_ids(self.fan)), {str(status.id), str(custom.id)})
+        self.assertEqual(self.feed_ids(self.stranger), [str(custom.id)])
+
+    def test_feed_query_count_is_flat(self):
+        for _ in range(5):
+            self.post(visibility='everyone')
+        self.feed_ids(self.friend)
+        self.client.force_authenticate(self.friend)
+        # Entries, fan-out-on-read statuses, then the views and reactions prefetches
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.client.get('/api/status/').data), 5)
+
+    def test_sweep_removes_expired_entries(self):
+        status = self.post(visibility='everyone')
+        StatusFeedEntry.objects.filter(status=status).update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('sweep_status_feed', batch=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 2 expired status feed entries')
+        self.assertFalse(StatusFeedEntry.objects.exists())
+
+    def test_detail_routes_use_the_same_feed(self):
+        delivered = self.post(visibility='everyone')
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 0):
+            wide = self.post(visibility='contacts')
+        self.client.force_authenticate(self.friend)
+        self.assertEqual(self.client.get(f'/api/status/{delivered.id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/status/{wide.id}/').status_code, 200)
+        self.client.force_authenticate(self.fan)
+        self.assertEqual(self.client.get(f'/api/status/{wide.id}/').status_code, 404)
+        self.assertEqual(self.client.post(f'/api/status/{delivered.id}/view/').status_code, 200)
+
+    def test_failed_fan_out_rolls_back_the_status(self):
+        self.client.force_authenticate(self.owner)
+        with mock.patch('user_status.serializers.fan_out', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/status/', {'status_type': 'text', 'text': 'hi'}, format='json')
+        self.assertFalse(StatusUpdate.objects.exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+    def test_feed_reads_are_driven_by_the_viewer_and_partial_indexes(self):
+        graph = contact_graph.graph_for(self.friend.id)
+        now = timezone.now()
+        entries_plan = feed.delivered_entries(self.friend, graph, now).explain()
+        self.assertIn('status_feed_viewer_idx', entries_plan)
+        self.assertNotIn('SCAN status_updates', entries_plan)
+        self.assertNotIn('expires_b74503', entries_plan)
+        self.assertIn('status_read_fanout_idx', feed.read_time_statuses(self.friend, graph, now).explain())
@@ -2,10 +2,10 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Prefetch
+from django.db.models import Prefetch, prefetch_related_objects
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from user_accounts.models import Contact
+from .feed import feed_for, feed_statuses
 from .models import StatusUpdate, StatusView, StatusReaction
 from .serializers import (
     StatusUpdateSerializer, CreateStatusSerializer,
@@ -22,15 +22,8 @@ class StatusUpdateViewSet(viewsets.ModelViewSet):
             return CreateStatusSerializer
         return StatusUpdateSerializer
     
-    def get_queryset(self):
-        user = self.request.user
-        
-        # Get statuses that user can view (not expired)
-        queryset = StatusUpdate.objects.filter(
-            expires_at__gt=timezone.now()
-        ).exclude(
-            owner=user  # Exclude own statuses from feed
-        ).select_related('owner').prefetch_related(
+    def get_prefetches(self):
+        return [
             Prefetch(
                 'views',
                 queryset=StatusView.objects.select_related('viewer')
@@ -39,30 +32,27 @@ class StatusUpdateViewSet(viewsets.ModelViewSet):
                 'reactions',
                 queryset=StatusReaction.objects.select_related('user')
             )
-        )
-        
-        # Filter based on visibility and contacts
-        contacts = Contact.objects.filter(
-            user=user, blocked=False
-        ).values_list('contact_id', flat=True)
-        
-        # Build visibility filter
-        visibility_filter = Q(visibility='everyone')
-        
-        # Add contacts visibility
-        if contacts:
-            visibility_filter |= Q(
-                visibility='contacts',
-                owner_id__in=contacts
-            )
+        ]
+    
+    def get_queryset(self):
+        user = self.request.user
         
-        # Add custom visibility (where user is explicitly added)
-        visibility_filter |= Q(
-            visibility='custom',
-            custom_viewers__user=user
-        )
+        # Get statuses that user can view (not expired)
+        queryset = StatusUpdate.objects.filter(
+            expires_at__gt=timezone.now()
+        ).exclude(
+            owner=user  # Exclude own statuses from feed
+        ).select_related('owner').prefetch_related(*self.get_prefetches())
         
-        return queryset.filter(visibility_filter).distinct().order_by('-created_at')
+        # Materialised feed entries plus any fan-out-on-read statuses
+        return feed_for(user, queryset).order_by('-created_at')
+    
+    def list(self, request, *args, **kwargs):
+        # Driven by the viewer's own feed entries rather than a filter over every live status
+        statuses = feed_statuses(request.user)
+        prefetch_related_objects(statuses, *self.get_prefetches())
+        serializer = self.get_serializer(statuses, many=True)
+        return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def my_statuses(self, request):
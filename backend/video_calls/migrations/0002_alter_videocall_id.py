@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-17 00:03
+
+import config.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video_calls', '0001_initial'),
+    ]
+
+    # The default is applied in Python only, so skip the table rebuild
+    # SQLite would otherwise perform for an AlterField on the key.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='videocall',
+                    name='id',
+                    field=models.UUIDField(default=config.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
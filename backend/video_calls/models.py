@@ -1,7 +1,7 @@
-import uuid
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from config.ids import uuid7
 
 class VideoCall(models.Model):
     CALL_STATUS = (
@@ -19,7 +19,7 @@ class VideoCall(models.Model):
         ('audio', 'Audio Call'),
     )
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     room = models.ForeignKey('messaging.Room', on_delete=models.CASCADE, related_name='video_calls')
     caller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='initiated_calls')
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_calls')
@@ -1,5 +1,6 @@
 import { BrowserRouter, Routes, Route, Navigate } from 'react-router-dom'
 import { AuthProvider, useAuth } from './contexts/AuthContext'
+import { PresenceProvider } from './contexts/PresenceContext'
 import Landing from './pages/Landing'
 import Login from './pages/Login'
 import Dashboard from './pages/Dashboard'
@@ -40,19 +41,21 @@ function PublicRoute({ children }) {
 export default function App() {
   return (
     <AuthProvider>
-      <BrowserRouter>
-        <Routes>
-          <Route path="/" element={<PublicRoute><Landing /></PublicRoute>} />
-          <Route path="/login" element={<PublicRoute><Login /></PublicRoute>} />
-          <Route path="/dashboard" element={<PrivateRoute><Dashboard /></PrivateRoute>} />
-          <Route path="/chat/:roomId" element={<PrivateRoute><Chat /></PrivateRoute>} />
-          <Route path="/call/:roomId" element={<PrivateRoute><VideoCall /></PrivateRoute>} />
-          <Route path="/status" element={<PrivateRoute><Status /></PrivateRoute>} />
-          <Route path="/settings" element={<PrivateRoute><Settings /></PrivateRoute>} />
-          <Route path="/invite/:token" element={<InviteAccept />} />
-          <Route path="*" element={<Navigate to="/" />} />
-        </Routes>
-      </BrowserRouter>
+      <PresenceProvider>
+        <BrowserRouter>
+          <Routes>
+            <Route path="/" element={<PublicRoute><Landing /></PublicRoute>} />
+            <Route path="/login" element={<PublicRoute><Login /></PublicRoute>} />
+            <Route path="/dashboard" element={<PrivateRoute><Dashboard /></PrivateRoute>} />
+            <Route path="/chat/:roomId" element={<PrivateRoute><Chat /></PrivateRoute>} />
+            <Route path="/call/:roomId" element={<PrivateRoute><VideoCall /></PrivateRoute>} />
+            <Route path="/status" element={<PrivateRoute><Status /></PrivateRoute>} />
+            <Route path="/settings" element={<PrivateRoute><Settings /></PrivateRoute>} />
+            <Route path="/invite/:token" element={<InviteAccept />} />
+            <Route path="*" element={<Navigate to="/" />} />
+          </Routes>
+        </BrowserRouter>
+      </PresenceProvider>
     </AuthProvider>
   )
 }
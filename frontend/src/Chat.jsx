@@ -31,11 +31,10 @@ export default function Chat() {
   const messagesContainerRef = useRef(null)
   const typingTimeoutRef = useRef(null)
 
-  // WebSocket URL with authentication
+  // WebSocket URL; useSocket adds the current access token on each connect
   const wsUrl = useMemo(() => {
-    const token = localStorage.getItem('access_token')
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-    return `${protocol}//${window.location.host}/ws/chat/${roomId}/?token=${token}`
+    return `${protocol}//${window.location.host}/ws/chat/${roomId}/`
   }, [roomId])
 
   // Initialize encryption key
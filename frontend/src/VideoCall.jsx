@@ -22,7 +22,7 @@ export default function VideoCall() {
   const [showControls, setShowControls] = useState(true)
 
   // WebSocket connection
-  const wsUrl = `ws://localhost:8000/ws/webrtc/${roomId}/?token=${localStorage.getItem('access_token')}`
+  const wsUrl = `ws://localhost:8000/ws/webrtc/${roomId}/`
   
   const handleWebRTCSignal = (data) => {
     switch (data.type) {
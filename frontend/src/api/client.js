@@ -6,4 +6,66 @@ const api = axios.create({
   headers: { 'Content-Type': 'application/json' },
 });
 
+export function storeTokens({ access, refresh }) {
+  if (access) localStorage.setItem('access_token', access);
+  if (refresh) localStorage.setItem('refresh_token', refresh);
+}
+
+export function clearTokens() {
+  localStorage.removeItem('access_token');
+  localStorage.removeItem('refresh_token');
+}
+
+api.interceptors.request.use(config => {
+  const token = localStorage.getItem('access_token');
+  if (token) config.headers.Authorization = `Bearer ${token}`;
+  return config;
+});
+
+let refreshing = null;
+
+// Swap the refresh token for a new pair; concurrent callers share one request
+export function refreshAccessToken() {
+  const refresh = localStorage.getItem('refresh_token');
+  if (!refresh) return Promise.resolve(false);
+  if (!refreshing) {
+    refreshing = api.post('/accounts/token/refresh/', { refresh })
+      .then(res => {
+        storeTokens(res.data);
+        return true;
+      })
+      .catch(error => {
+        clearTokens();
+        throw error;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+}
+
+// Sockets cannot send headers, so the access token rides in the query string when there is one
+export function withAccessToken(url) {
+  const token = localStorage.getItem('access_token');
+  if (!token) return url;
+  return `${url}${url.includes('?') ? '&' : '?'}token=${encodeURIComponent(token)}`;
+}
+
+// Access tokens are short-lived; swap the refresh token for a new one once per failed request
+api.interceptors.response.use(null, async error => {
+  const { config, response } = error;
+  const refresh = localStorage.getItem('refresh_token');
+  if (response?.status !== 401 || !refresh || config._retried || config.url === '/accounts/token/refresh/') {
+    throw error;
+  }
+  config._retried = true;
+  try {
+    await refreshAccessToken();
+  } catch {
+    throw error;
+  }
+  return api(config);
+});
+
 export default api;
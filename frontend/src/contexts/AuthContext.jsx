@@ -1,5 +1,5 @@
 import { createContext, useContext, useState, useEffect } from 'react';
-import api from '../api/client';
+import api, { clearTokens, storeTokens } from '../api/client';
 
 const AuthContext = createContext(null);
 
@@ -14,6 +14,7 @@ export function AuthProvider({ children }) {
 
   const login = async (email, password) => {
     const res = await api.post('/accounts/login/', { email, password });
+    storeTokens(res.data);
     setUser(res.data.user);
   };
 
@@ -24,11 +25,13 @@ export function AuthProvider({ children }) {
       password,
       password_confirm
     });
+    storeTokens(res.data);
     setUser(res.data.user);
   };
 
   const logout = async () => {
     await api.post('/accounts/logout/');
+    clearTokens();
     setUser(null);
   };
 
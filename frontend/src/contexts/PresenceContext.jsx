@@ -0,0 +1,51 @@
+import { createContext, useCallback, useContext, useMemo, useState } from 'react';
+import { useAuth } from './AuthContext';
+import useSocket from '../hooks/useSocket';
+
+const PresenceContext = createContext({});
+
+// One presence socket per tab, whatever page is open: it keeps the user
+// online and is the only socket presence diffs are delivered to
+export function PresenceProvider({ children }) {
+  const { user } = useAuth();
+  const [presence, setPresence] = useState({});
+
+  const url = useMemo(() => {
+    if (!user?.id) return null;
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    return `${protocol}//${window.location.host}/ws/presence/`;
+  }, [user?.id]);
+
+  const handleMessage = useCallback((data) => {
+    if (data.type !== 'presence') return;
+    // Batched diff: only users whose state changed since the last frame
+    setPresence(prev => {
+      const next = { ...prev };
+      data.changes.forEach(change => {
+        next[change.user_id] = change;
+      });
+      return next;
+    });
+  }, []);
+
+  useSocket(url, handleMessage);
+
+  return (
+    <PresenceContext.Provider value={presence}>
+      {children}
+    </PresenceContext.Provider>
+  );
+}
+
+export const usePresence = () => useContext(PresenceContext);
+
+// A user as loaded from the API, updated with any later presence diff
+export function withPresence(person, presence) {
+  const change = person && presence[person.id];
+  if (!change) return person;
+  return {
+    ...person,
+    is_online: change.is_online,
+    last_seen: change.last_seen || person.last_seen
+  };
+}
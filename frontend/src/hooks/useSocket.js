@@ -1,4 +1,5 @@
 import { useEffect, useRef, useState, useCallback } from 'react'
+import { refreshAccessToken, withAccessToken } from '../api/client'
 
 export default function useSocket(url, onMessage, onOpen, onClose) {
   const wsRef = useRef(null)
@@ -6,19 +7,27 @@ export default function useSocket(url, onMessage, onOpen, onClose) {
   const [error, setError] = useState(null)
   const reconnectTimeoutRef = useRef(null)
   const reconnectAttemptsRef = useRef(0)
+  const heartbeatRef = useRef(null)
   const maxReconnectAttempts = 5
+  // Keeps presence alive server-side; must stay well under its 90s expiry
+  const heartbeatInterval = 30000
 
   const connect = useCallback(() => {
     if (!url) return
 
     try {
-      const ws = new WebSocket(url)
+      const ws = new WebSocket(withAccessToken(url))
       wsRef.current = ws
 
       ws.onopen = () => {
         setConnected(true)
         setError(null)
         reconnectAttemptsRef.current = 0
+        heartbeatRef.current = setInterval(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ type: 'heartbeat' }))
+          }
+        }, heartbeatInterval)
         onOpen && onOpen()
       }
 
@@ -33,6 +42,7 @@ export default function useSocket(url, onMessage, onOpen, onClose) {
 
       ws.onclose = (event) => {
         setConnected(false)
+        clearInterval(heartbeatRef.current)
         onClose && onClose(event)
 
         // Attempt to reconnect if not a manual close
@@ -40,7 +50,8 @@ export default function useSocket(url, onMessage, onOpen, onClose) {
           const timeout = Math.pow(2, reconnectAttemptsRef.current) * 1000
           reconnectTimeoutRef.current = setTimeout(() => {
             reconnectAttemptsRef.current++
-            connect()
+            // The access token may have expired since the last handshake
+            refreshAccessToken().catch(() => {}).finally(connect)
           }, timeout)
         }
       }
@@ -1,6 +1,7 @@
 import { useEffect, useState, useRef, useMemo } from 'react'
 import { useParams, Link, useNavigate } from 'react-router-dom'
 import { useAuth } from '../contexts/AuthContext'
+import { usePresence, withPresence } from '../contexts/PresenceContext'
 import useSocket from '../hooks/useSocket'
 import api from '../api/client'
 import { encrypt, decrypt, generateSessionKey, getSessionKey } from '../api/crypto'
@@ -14,6 +15,7 @@ import {
 export default function Chat() {
   const { roomId } = useParams()
   const { user } = useAuth()
+  const presence = usePresence()
   const navigate = useNavigate()
   
   const [messages, setMessages] = useState([])
@@ -24,18 +26,17 @@ export default function Chat() {
   const [sending, setSending] = useState(false)
   const [typingUsers, setTypingUsers] = useState(new Set())
   const [encryptionKey, setEncryptionKey] = useState(null)
-  const [page, setPage] = useState(1)
+  const [nextUrl, setNextUrl] = useState(null)
   const [hasMore, setHasMore] = useState(true)
   
   const messagesEndRef = useRef(null)
   const messagesContainerRef = useRef(null)
   const typingTimeoutRef = useRef(null)
 
-  // WebSocket URL with authentication
+  // WebSocket URL; useSocket adds the current access token on each connect
   const wsUrl = useMemo(() => {
-    const token = localStorage.getItem('access_token')
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-    return `${protocol}//${window.location.host}/ws/chat/${roomId}/?token=${token}`
+    return `${protocol}//${window.location.host}/ws/chat/${roomId}/`
   }, [roomId])
 
   // Initialize encryption key
@@ -81,7 +82,10 @@ export default function Chat() {
               ...data.message,
               decrypted_content: decryptedContent
             }
-            setMessages(prev => [messageWithDecryption, ...prev])
+            // A retried send is acked with the stored copy; don't show it twice
+            setMessages(prev => prev.some(m => m.id === data.message.id)
+              ? prev
+              : [messageWithDecryption, ...prev])
           }
         } catch (error) {
           console.error('Decryption failed:', error)
@@ -132,9 +136,10 @@ export default function Chat() {
     }
   }
 
-  const loadMessages = async (pageNum = 1) => {
+  const loadMessages = async (cursorUrl = null) => {
     try {
-      const response = await api.get(`/chat/messages/?room=${roomId}&page=${pageNum}`)
+      // The backend returns opaque `next` links; follow them for older pages
+      const response = await api.get(cursorUrl || `/chat/messages/?room=${roomId}`)
       const newMessages = response.data.results || response.data
       
       if (encryptionKey) {
@@ -157,13 +162,14 @@ export default function Chat() {
           })
         )
         
-        if (pageNum === 1) {
+        if (!cursorUrl) {
           setMessages(decryptedMessages.reverse())
         } else {
           setMessages(prev => [...decryptedMessages.reverse(), ...prev])
         }
       }
       
+      setNextUrl(response.data.next)
       setHasMore(response.data.next != null)
     } catch (error) {
       console.error('Error loading messages:', error)
@@ -185,6 +191,7 @@ export default function Chat() {
       // Send via WebSocket
       const success = sendWebSocketMessage({
         type: 'message',
+        client_message_id: crypto.randomUUID(),
         message_type: 'text',
         ciphertext,
         nonce,
@@ -233,8 +240,7 @@ export default function Chat() {
 
   const loadMoreMessages = () => {
     if (hasMore && !loading) {
-      loadMessages(page + 1)
-      setPage(prev => prev + 1)
+      loadMessages(nextUrl)
     }
   }
 
@@ -291,6 +297,8 @@ export default function Chat() {
     )
   }
 
+  const peer = withPresence(otherUser, presence)
+
   return (
     <div className="flex flex-col h-screen bg-gray-50">
       {/* Header */}
@@ -310,7 +318,7 @@ export default function Chat() {
                 alt={otherUser?.username}
                 className="w-10 h-10 rounded-full"
               />
-              {otherUser?.is_online && (
+              {peer?.is_online && (
                 <div className="online-indicator"></div>
               )}
             </div>
@@ -322,9 +330,9 @@ export default function Chat() {
               <p className="text-xs text-gray-500">
                 {typingUsers.size > 0 
                   ? `${Array.from(typingUsers).join(', ')} typing...`
-                  : otherUser?.is_online 
+                  : peer?.is_online 
                     ? 'Online' 
-                    : `Last seen ${formatTime(otherUser?.last_seen)}`
+                    : `Last seen ${formatTime(peer?.last_seen)}`
                 }
               </p>
             </div>
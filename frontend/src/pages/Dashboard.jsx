@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react'
 import { useAuth } from '../contexts/AuthContext'
+import { usePresence, withPresence } from '../contexts/PresenceContext'
 import { Link, useNavigate } from 'react-router-dom'
 import QRCode from 'react-qr-code'
 import api from '../api/client'
@@ -15,6 +16,7 @@ import {
 
 export default function Dashboard() {
   const { user, logout, searchUsers } = useAuth()
+  const presence = usePresence()
   const navigate = useNavigate()
   
   const [rooms, setRooms] = useState([])
@@ -302,7 +304,7 @@ export default function Dashboard() {
         ) : (
           <div className="grid gap-4">
             {rooms.map(room => {
-              const otherUser = room.participants?.find(p => p.id !== user.id)
+              const otherUser = withPresence(room.participants?.find(p => p.id !== user.id), presence)
               return (
                 <Link
                   key={room.id}
@@ -327,7 +329,7 @@ export default function Dashboard() {
                           {otherUser?.username || 'Unknown User'}
                         </h3>
                         <span className="text-xs text-gray-500">
-                          {formatLastSeen(room.updated_at)}
+                          {formatLastSeen(room.last_activity_at || room.updated_at)}
                         </span>
                       </div>
                       